@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def content_hash(data):
+    """SHA-256 of raw upload bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_key(content_digest, model_version, kind="image"):
+    """Cache key for one upload's analysis: changes whenever the bytes, the models or the analysis kind change."""
+    return hashlib.sha256(f"{kind}|{model_version}|{content_digest}".encode()).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache of YOLO+CLIP results.
+    The memory tier is an LRU of at most `max_entries` results. If `disk_dir` is set, results are
+    also written there as <key>.json and the directory is trimmed (least recently used first) to
+    `max_disk_bytes`. Values must be JSON-serializable; callers always get their own copy back.
+    """
+
+    def __init__(self, max_entries=256, disk_dir=None, max_disk_bytes=512 * 1024 * 1024):
+        self.max_entries = max(0, int(max_entries))
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max(0, int(max_disk_bytes))
+        self._memory = OrderedDict() # key -> JSON string, so stored values can't be mutated by callers
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _remember(self, key, payload):
+        self._memory[key] = payload
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return a copy of the cached result for `key`, or None."""
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self._hits += 1
+                return json.loads(payload)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    payload = f.read()
+                os.utime(path) # Mark as recently used for disk eviction
+                result = json.loads(payload)
+            except (OSError, ValueError):
+                pass
+            else:
+                with self._lock:
+                    self._remember(key, payload)
+                    self._hits += 1
+                    self._disk_hits += 1
+                return result
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, key, result):
+        payload = json.dumps(result)
+        with self._lock:
+            self._remember(key, payload)
+        if self.disk_dir:
+            try:
+                tmp_path = f"{self._disk_path(key)}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(payload)
+                os.replace(tmp_path, self._disk_path(key))
+                self._trim_disk()
+            except OSError as e:
+                print(f"⚠️ Could not write analysis cache entry {key}: {e}")
+
+    def _trim_disk(self):
+        entries = []
+        total_bytes = 0
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+        if total_bytes <= self.max_disk_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            if total_bytes <= self.max_disk_bytes:
+                break
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_dir": self.disk_dir,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
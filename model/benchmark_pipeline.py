@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# The benchmark must not append to the real embedding store when it imports main
+os.environ.setdefault("EMBEDDING_STORE_DIR", "")
+
+import cv2
+import numpy as np
+import torch
+from safetensors.torch import save_file
+from transformers import CLIPImageProcessor, CLIPVisionConfig, CLIPVisionModelWithProjection
+from ultralytics import YOLO
+
+import clip_pipeline
+from clip_pipeline import CLIP_SLIM_FORMAT, FewShotFineTunedCLIP, build_classifier_head, crime_classes, few_shot_crime_prompts
+import main
+
+STAGES = ("imdecode", "yolo", "clip_preprocess", "clip_forward", "extract_frames", "frame_difference", "aggregation")
+FRAME_SIZES = {"480p": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+# Extra shapes for the preprocessing parity check: portrait, already square, and upscaled
+PARITY_SIZES = {**FRAME_SIZES, "portrait": (360, 640), "square": (224, 224), "tiny": (160, 120)}
+
+
+# --- Synthetic inputs ---
+
+def synthetic_frame(width, height, t=0, seed=0):
+    """A smooth gradient with a moving block and some noise: compresses and hashes like a real scene."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)),
+                      np.full((height, width), (seed * 37) % 256, dtype=np.float32)], axis=-1)
+    frame = frame + rng.normal(0, 8, frame.shape)
+    size = max(8, min(width, height) // 5)
+    left = int((t * 7) % max(1, width - size))
+    top = int((t * 3) % max(1, height - size))
+    frame[top:top + size, left:left + size] = (40, 200, 240)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+def synthetic_jpegs(width, height, count):
+    return [cv2.imencode(".jpg", synthetic_frame(width, height, t=i, seed=i))[1].tobytes() for i in range(count)]
+
+def synthetic_video(path, width=640, height=480, frames=300, fps=30, scene_length=60):
+    """An MP4 with a moving block and a scene cut every `scene_length` frames."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    for i in range(frames):
+        writer.write(synthetic_frame(width, height, t=i, seed=i // scene_length))
+    writer.release()
+    return path
+
+
+# --- Stand-in models (random weights) ---
+
+def random_clip(directory):
+    """FewShotFineTunedCLIP with randomly initialized ViT-B/32-shaped weights, via a slim checkpoint (no downloads)."""
+    config = CLIPVisionConfig(projection_dim=512)
+    vision = CLIPVisionModelWithProjection(config).eval()
+    head = build_classifier_head(config.projection_dim).eval()
+    text_embeds = torch.nn.functional.normalize(torch.randn(len(crime_classes), config.projection_dim), dim=-1)
+    tensors = {f"model.{name}": tensor for name, tensor in vision.state_dict().items()}
+    tensors.update({f"classifier.{name}": tensor for name, tensor in head.state_dict().items()})
+    tensors["text_embeds"] = text_embeds
+    path = os.path.join(directory, "clip_random.safetensors")
+    save_file({name: tensor.contiguous() for name, tensor in tensors.items()}, path, metadata={
+        "format": CLIP_SLIM_FORMAT,
+        "model_name": "openai/clip-vit-base-patch32",
+        "source_checkpoint": "",
+        "use_finetuned": "true",
+        "logit_scale": "100.0",
+        "crime_classes": json.dumps(crime_classes),
+        "prompts": json.dumps(few_shot_crime_prompts),
+        "vision_config": config.to_json_string(use_diff=False),
+        "image_processor": CLIPImageProcessor().to_json_string(),
+    })
+    return FewShotFineTunedCLIP(model_path=path)
+
+def random_yolo(config="yolov8n.yaml"):
+    """YOLOv8 built from its architecture YAML, so weights are random and nothing is downloaded."""
+    return YOLO(config)
+
+
+# --- Timing ---
+
+def time_fn(fn, repeats, warmup=2, items=1):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    median = statistics.median(timings)
+    return {
+        "median_ms": round(median, 3),
+        "p90_ms": round(timings[int(0.9 * (len(timings) - 1))], 3),
+        "min_ms": round(timings[0], 3),
+        "items": items,
+        "per_item_ms": round(median / items, 3),
+        "items_per_s": round(1000 * items / median, 2) if median > 0 else None,
+    }
+
+def threaded(fn, inputs, threads):
+    """Apply fn to every input on a pool of `threads` threads (the GIL-releasing OpenCV calls scale)."""
+    if threads == 1:
+        return lambda: [fn(x) for x in inputs]
+    pool = ThreadPoolExecutor(max_workers=threads)
+    return lambda: list(pool.map(fn, inputs))
+
+
+# --- Stages ---
+
+def bench_imdecode(args, threads, results):
+    for label, (width, height) in FRAME_SIZES.items():
+        jpegs = synthetic_jpegs(width, height, 16)
+        decode = lambda data: cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        results[f"imdecode/{label}/threads={threads}"] = time_fn(threaded(decode, jpegs, threads), args.repeats, items=len(jpegs))
+
+def bench_yolo(args, threads, results):
+    for label, (width, height) in FRAME_SIZES.items():
+        frame = synthetic_frame(width, height)
+        results[f"yolo_detect_objects/{label}/threads={threads}"] = time_fn(lambda: main.yolo_detect_objects(frame), args.repeats)
+    frames = [synthetic_frame(640, 480, t=i) for i in range(max(args.batch_sizes))]
+    for batch_size in args.batch_sizes:
+        batch = frames[:batch_size]
+        results[f"yolo_detect_batch/480p/batch={batch_size}/threads={threads}"] = time_fn(
+            lambda: main.yolo_detect_batch(batch, batch_size=batch_size), args.repeats, items=batch_size
+        )
+
+def bench_clip_preprocess(args, threads, results):
+    for label, (width, height) in FRAME_SIZES.items():
+        frames = [synthetic_frame(width, height, t=i) for i in range(max(args.batch_sizes))]
+        for batch_size in args.batch_sizes:
+            batch = frames[:batch_size]
+            results[f"clip_preprocess/{label}/batch={batch_size}/threads={threads}"] = time_fn(
+                lambda: clip_pipeline.preprocess_images(batch, fast=False), args.repeats, items=batch_size
+            )
+            results[f"clip_preprocess_fast/{label}/batch={batch_size}/threads={threads}"] = time_fn(
+                lambda: clip_pipeline.preprocess_images(batch, reuse=True, fast=True), args.repeats, items=batch_size
+            )
+
+def bench_clip_forward(args, threads, results):
+    classifier = clip_pipeline.clip_classifier
+    frames = [synthetic_frame(640, 480, t=i) for i in range(max(args.batch_sizes))]
+    for mode, use_finetuned in (("finetuned", True), ("zeroshot", False)):
+        classifier.use_finetuned = use_finetuned
+        for batch_size in args.batch_sizes:
+            pixel_values = clip_pipeline.preprocess_images(frames[:batch_size])
+            names = [f"frame_{i}" for i in range(batch_size)]
+            results[f"clip_forward_{mode}/batch={batch_size}/threads={threads}"] = time_fn(
+                lambda: clip_pipeline.classify_pixel_values(pixel_values, names), args.repeats, items=batch_size
+            )
+    classifier.use_finetuned = True
+
+def bench_extract_frames(args, threads, results, workdir):
+    video = synthetic_video(os.path.join(workdir, "synthetic.mp4"), frames=args.video_frames)
+    output_folder = os.path.join(workdir, "frames")
+    for seek in (False, True):
+        mode = "seek" if seek else "grab"
+        results[f"extract_frames/{mode}/threads={threads}"] = time_fn(
+            lambda: clip_pipeline.extract_frames(video, output_folder=output_folder, seek=seek), args.repeats, warmup=1
+        )
+        results[f"iter_frames/{mode}/threads={threads}"] = time_fn(
+            lambda: list(clip_pipeline.iter_frames(video, seek=seek)), args.repeats, warmup=1
+        )
+
+def bench_frame_difference(args, threads, results):
+    for label, (width, height) in FRAME_SIZES.items():
+        pairs = [(synthetic_frame(width, height, t=i), synthetic_frame(width, height, t=i + 1)) for i in range(16)]
+        diff = lambda pair: clip_pipeline.calculate_frame_difference(*pair)
+        results[f"calculate_frame_difference/{label}/threads={threads}"] = time_fn(
+            threaded(diff, pairs, threads), args.repeats, items=len(pairs)
+        )
+        deduplicator = clip_pipeline.FrameDeduplicator()
+        frames = [frame for pair in pairs for frame in pair]
+        results[f"frame_dedup_hash/{label}/threads={threads}"] = time_fn(
+            threaded(deduplicator.frame_hash, frames, threads), args.repeats, items=len(frames)
+        )
+
+def bench_aggregation(args, threads, results):
+    rng = np.random.default_rng(0)
+    for count in (50, 1000):
+        predictions = [{
+            "image_name": f"frame_{i}", "predicted_class": crime_classes[int(rng.integers(len(crime_classes)))],
+            "crime_confidence": round(float(rng.random()), 3), "model_type": "clip-few-shot-finetuned",
+        } for i in range(count)]
+        results[f"aggregate_predictions/n={count}/threads={threads}"] = time_fn(
+            lambda: clip_pipeline.aggregate_predictions([dict(p) for p in predictions]), args.repeats, items=count
+        )
+    frames = [synthetic_frame(640, 480, t=i) for i in range(16)]
+    results[f"predict_multiple_images/n=16/threads={threads}"] = time_fn(
+        lambda: clip_pipeline.predict_multiple_images(frames), args.repeats, warmup=1, items=len(frames)
+    )
+
+
+def check_preprocess_parity(workdir):
+    """preprocess_images vs CLIPProcessor on every PARITY_SIZES shape. Returns True if all are within tolerance."""
+    clip_pipeline.clip_classifier = random_clip(workdir)
+    all_ok = True
+    for label, (width, height) in PARITY_SIZES.items():
+        frames = [synthetic_frame(width, height, t=i, seed=i) for i in range(4)]
+        report = clip_pipeline.check_preprocess_parity(frames)
+        all_ok = all_ok and report["ok"]
+        flag = "✅" if report["ok"] else "❌"
+        print(f"  {flag} {label:10} {width}x{height}: mean |diff| {report['mean_abs_diff']:.5f}, max |diff| {report['max_abs_diff']:.5f}")
+    return all_ok
+
+
+# --- Baseline comparison ---
+
+def compare(current, baseline, threshold):
+    """Per-benchmark median ratio vs the baseline. A ratio above 1 + threshold is a regression."""
+    rows = []
+    for name, result in current.items():
+        if name not in baseline:
+            continue
+        ratio = result["median_ms"] / baseline[name]["median_ms"] if baseline[name]["median_ms"] > 0 else 1.0
+        rows.append({
+            "benchmark": name, "baseline_ms": baseline[name]["median_ms"], "current_ms": result["median_ms"],
+            "ratio": round(ratio, 3), "regression": ratio > 1 + threshold,
+        })
+    return rows
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Time each stage of the analysis pipeline on synthetic inputs with random-weight models.")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of: {', '.join(STAGES)}")
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    parser.add_argument("--threads", default="1,4", help="Comma-separated torch/OpenCV thread counts")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--video-frames", type=int, default=300)
+    parser.add_argument("--yolo-config", default="yolov8n.yaml", help="Ultralytics architecture YAML for the random-weight YOLO")
+    parser.add_argument("--output", default=None, help="Write the JSON results here")
+    parser.add_argument("--baseline", default=None, help="Compare against this earlier --output file")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown vs the baseline (0.15 = 15%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline instead of comparing")
+    parser.add_argument("--check-preprocess-parity", action="store_true",
+                        help="Only compare the fast frame preprocessing against CLIPProcessor and exit (non-zero on mismatch)")
+    args = parser.parse_args()
+    if args.check_preprocess_parity:
+        print("🔍 Fast CLIP preprocessing vs CLIPProcessor:")
+        if not check_preprocess_parity(tempfile.mkdtemp(prefix="detectifi_parity_")):
+            raise SystemExit(1)
+        print("✅ Fast preprocessing matches CLIPProcessor within tolerance.")
+        return
+    args.batch_sizes = [int(v) for v in args.batch_sizes.split(",")]
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="detectifi_bench_")
+    print("🔧 Building random-weight stand-in models...")
+    if "yolo" in stages:
+        main.yolo_model = random_yolo(args.yolo_config)
+    if {"clip_preprocess", "clip_forward", "aggregation"} & set(stages):
+        clip_pipeline.clip_classifier = random_clip(workdir)
+
+    results = {}
+    for threads in [int(v) for v in args.threads.split(",")]:
+        torch.set_num_threads(threads)
+        cv2.setNumThreads(threads)
+        for stage in stages:
+            print(f"⏱ {stage} (threads={threads})")
+            if stage == "extract_frames":
+                bench_extract_frames(args, threads, results, workdir)
+            else:
+                globals()[f"bench_{stage}"](args, threads, results)
+
+    report = {
+        "meta": {
+            "created_at": time.time(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "opencv": cv2.__version__,
+            "device": str(clip_pipeline.device),
+            "cpu_count": os.cpu_count(),
+            "repeats": args.repeats,
+        },
+        "results": results,
+    }
+    for name, result in results.items():
+        print(f"  {name:60} median {result['median_ms']:9.3f} ms  ({result['per_item_ms']:.3f} ms/item)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Baseline saved to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        rows = compare(results, baseline, args.threshold)
+        regressions = [row for row in rows if row["regression"]]
+        print(f"\n📊 vs baseline {args.baseline} (threshold +{args.threshold:.0%}):")
+        for row in rows:
+            flag = "❌" if row["regression"] else "✅"
+            print(f"  {flag} {row['benchmark']:60} {row['baseline_ms']:9.3f} -> {row['current_ms']:9.3f} ms (x{row['ratio']:.2f})")
+        if regressions:
+            print(f"❌ {len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}.")
+            raise SystemExit(1)
+        print("✅ No regressions.")
+
+
+if __name__ == "__main__":
+    main_cli()
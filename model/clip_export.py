@@ -0,0 +1,167 @@
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+import clip_pipeline
+from clip_pipeline import CLIP_EXPORT_DIR, CLIP_EXPORT_FILES, FewShotFineTunedCLIP
+
+
+class VisionClassifierGraph(nn.Module):
+    """Vision tower + projection + classifier head as one graph: pixel_values -> (image_embeds, logits)."""
+
+    def __init__(self, clip_model, classifier):
+        super().__init__()
+        self.vision_model = clip_model.vision_model
+        self.visual_projection = clip_model.visual_projection
+        self.classifier = classifier
+
+    def forward(self, pixel_values):
+        pooled_output = self.vision_model(pixel_values=pixel_values, return_dict=False)[1]
+        image_embeds = self.visual_projection(pooled_output)
+        image_embeds = image_embeds / image_embeds.norm(dim=-1, keepdim=True)
+        return image_embeds, self.classifier(image_embeds)
+
+
+def export_metadata(eager, export_dir):
+    """Write the cached prompt embeddings and class list that every exported backend loads."""
+    path = os.path.join(export_dir, CLIP_EXPORT_FILES["metadata"])
+    np.savez(
+        path,
+        text_embeds=eager.text_embeds.detach().cpu().numpy().astype(np.float32),
+        logit_scale=np.float32(eager.logit_scale),
+        use_finetuned=np.bool_(eager.use_finetuned),
+        crime_classes=np.array(eager.class_names),
+        prompts=np.array([eager.prompts[name] for name in eager.class_names]),
+    )
+    print(f"💾 Prompt embeddings saved to {path}")
+    return path
+
+
+def export_torchscript(graph, example_inputs, export_dir):
+    path = os.path.join(export_dir, CLIP_EXPORT_FILES["torchscript"])
+    with torch.no_grad():
+        traced = torch.jit.trace(graph, example_inputs)
+    traced.save(path)
+    print(f"💾 TorchScript graph saved to {path}")
+    return path
+
+
+def export_onnx(graph, example_inputs, export_dir, opset=17):
+    path = os.path.join(export_dir, CLIP_EXPORT_FILES["onnxruntime"])
+    with torch.no_grad():
+        torch.onnx.export(
+            graph, (example_inputs,), path,
+            input_names=["pixel_values"],
+            output_names=["image_embeds", "logits"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=opset,
+        )
+    print(f"💾 ONNX graph saved to {path}")
+    return path
+
+
+def _outputs(classifier, pixel_values):
+    """(image_embeds, head logits, zero-shot logits) for one backend."""
+    image_embeds = classifier.encode_images(pixel_values)
+    head_logits = classifier.head_logits(pixel_values)
+    zero_shot_logits = classifier.logit_scale * image_embeds @ classifier.text_embeds.t()
+    return image_embeds, head_logits, zero_shot_logits
+
+
+def parity_check(eager, exported, pixel_values):
+    """Compare every exported backend's outputs with the eager model on the same inputs."""
+    reference = _outputs(eager, pixel_values)
+    report = {}
+    for backend, classifier in exported.items():
+        candidate = _outputs(classifier, pixel_values)
+        report[backend] = {
+            "max_abs_diff_image_embeds": (reference[0] - candidate[0]).abs().max().item(),
+            "max_abs_diff_head_logits": (reference[1] - candidate[1]).abs().max().item(),
+            "top1_agreement_head": (reference[1].argmax(dim=1) == candidate[1].argmax(dim=1)).float().mean().item(),
+            "top1_agreement_zero_shot": (reference[2].argmax(dim=1) == candidate[2].argmax(dim=1)).float().mean().item(),
+        }
+    return report
+
+
+def benchmark(classifiers, pixel_values, runs=20, warmup=3):
+    """Median/p90 latency of the image forward (embeddings + head) per backend, in milliseconds."""
+    report = {}
+    for backend, classifier in classifiers.items():
+        for _ in range(warmup):
+            classifier.head_logits(pixel_values)
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            classifier.head_logits(pixel_values)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        report[backend] = {
+            "batch_size": pixel_values.shape[0],
+            "median_ms": round(statistics.median(timings), 2),
+            "p90_ms": round(timings[int(0.9 * (len(timings) - 1))], 2),
+        }
+    return report
+
+
+def _example_inputs(eager, batch_size, image_folder=None):
+    """Real preprocessed images if a folder is given, otherwise random pixel values of the right shape."""
+    if image_folder:
+        names = sorted(f for f in os.listdir(image_folder) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')))
+        paths = [os.path.join(image_folder, name) for name in names[:batch_size]]
+        if paths:
+            clip_pipeline.clip_classifier = eager
+            return clip_pipeline.preprocess_images(paths)
+    config = eager.model.config
+    image_size = getattr(config, "vision_config", config).image_size # Slim checkpoints hold the vision config itself
+    return torch.randn(batch_size, 3, image_size, image_size, device=eager.device)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the CLIP vision tower + classifier head to TorchScript and ONNX.")
+    parser.add_argument("--checkpoint", default="clip.pth", help="Fine-tuned CLIP checkpoint (zero-shot CLIP if missing)")
+    parser.add_argument("--export-dir", default=CLIP_EXPORT_DIR)
+    parser.add_argument("--batch-size", type=int, default=8, help="Batch size for the parity check and latency comparison")
+    parser.add_argument("--images", default=None, help="Optional folder of images to use instead of random inputs")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--skip-onnx", action="store_true")
+    args = parser.parse_args()
+
+    os.makedirs(args.export_dir, exist_ok=True)
+    eager = FewShotFineTunedCLIP(model_path=args.checkpoint, backend="torch")
+    graph = VisionClassifierGraph(eager.model, eager.classifier).eval()
+    example_inputs = _example_inputs(eager, args.batch_size, args.images)
+
+    export_metadata(eager, args.export_dir)
+    backends = ["torchscript"]
+    export_torchscript(graph, example_inputs, args.export_dir)
+    if not args.skip_onnx:
+        try:
+            export_onnx(graph, example_inputs, args.export_dir, opset=args.opset)
+            backends.append("onnxruntime")
+        except Exception as e:
+            print(f"⚠️ ONNX export failed, skipping onnxruntime backend: {e}")
+
+    exported = {}
+    for backend in backends:
+        try:
+            exported[backend] = FewShotFineTunedCLIP(backend=backend, export_dir=args.export_dir)
+        except ImportError as e:
+            print(f"⚠️ Skipping {backend}: {e}")
+
+    print("\n🔬 Parity vs eager PyTorch:")
+    for backend, result in parity_check(eager, exported, example_inputs).items():
+        print(f"  {backend:12}: " + ", ".join(f"{key}={value:.6f}" for key, value in result.items()))
+
+    print("\n⏱ Latency per backend:")
+    for backend, result in benchmark({"torch": eager, **exported}, example_inputs, runs=args.runs).items():
+        print(f"  {backend:12}: median {result['median_ms']:.2f} ms, p90 {result['p90_ms']:.2f} ms (batch {result['batch_size']})")
+
+
+if __name__ == "__main__":
+    main()
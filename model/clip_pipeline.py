@@ -1,8 +1,12 @@
 import os
+import gc
+import json
+import threading
 import torch
 from PIL import Image
 import cv2
 import numpy as np
+from collections import deque
 # torchvision.transforms might still be used by CLIPProcessor or other parts,
 # but if vit_transforms was its only use, it could be conditionally removed.
 # For safety, keeping it unless explicitly confirmed it's not needed by CLIP parts.
@@ -10,12 +14,27 @@ import numpy as np
 from tqdm import tqdm
 import torch.nn as nn
 
-from transformers import CLIPProcessor, CLIPModel
+from transformers import CLIPImageProcessor, CLIPProcessor, CLIPModel, CLIPVisionConfig, CLIPVisionModelWithProjection
+from transformers.modeling_utils import no_init_weights
+
+import metrics
 # from vit_new import VisionTransformer # Removed: ViT specific
 
 # === Config ===
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 FRAME_FOLDER = "frames" # Default frame folder, can be overridden
+CLIP_BATCH_SIZE = 16 # Images per CLIP forward in predict_batch
+FRAME_DEDUP_WINDOW = 4 # Recently kept frames each new video frame is compared against
+FRAME_DEDUP_MAX_DISTANCE = 5 # Max dHash Hamming distance (of 64 bits) for a frame to count as a duplicate
+CLIP_BACKENDS = ("torch", "torchscript", "onnxruntime")
+CLIP_EXPORT_DIR = "clip_export" # Where clip_export.py writes the exported graphs
+CLIP_EXPORT_FILES = {
+    "torchscript": "clip_vision.torchscript.pt",
+    "onnxruntime": "clip_vision.onnx",
+    "metadata": "clip_prompt_embeddings.npz", # Cached text embeddings, logit scale and class list
+}
+CLIP_SLIM_FORMAT = "detectifi-clip-slim-v1" # Format tag in the metadata of checkpoints written by clip_slim_checkpoint.py
+CLIP_FAST_PREPROCESS = os.getenv("CLIP_FAST_PREPROCESS", "1") == "1" # Batched OpenCV/torch preprocessing for ndarray inputs instead of CLIPProcessor
 
 # === Class labels ===
 crime_classes = [
@@ -46,21 +65,172 @@ few_shot_crime_prompts = {
 # vit_transforms removed as it was ViT specific
 
 # === Model initialization ===
+def build_classifier_head(projection_dim):
+    """Lightweight classification head on normalized image embeddings (matching training)."""
+    return nn.Sequential(
+        nn.Dropout(0.3),
+        nn.Linear(projection_dim, 512),
+        nn.ReLU(),
+        nn.BatchNorm1d(512),
+        nn.Dropout(0.2),
+        nn.Linear(512, len(crime_classes))
+    )
+
+def is_slim_checkpoint(model_path):
+    return bool(model_path) and model_path.endswith(".safetensors")
+
+class FramePreprocessor:
+    """
+    CLIPImageProcessor's resize -> center crop -> rescale -> normalize, for batches of BGR uint8 frames.
+    Frames are resized (shortest edge, bicubic) and cropped with OpenCV straight into a uint8 staging
+    batch, then converted to a normalized RGB float tensor with one strided copy and one fused
+    multiply-add per channel. The staging batch is per thread and reused across calls, as is the
+    output tensor when `reuse=True`. Real downscaling uses INTER_AREA because PIL's bicubic antialiases
+    when shrinking and OpenCV's INTER_CUBIC does not, so results match CLIPProcessor within
+    interpolation error rather than bit-for-bit (see check_preprocess_parity).
+    """
+
+    def __init__(self, shortest_edge=224, crop_size=(224, 224), image_mean=(0.48145466, 0.4578275, 0.40821073),
+                 image_std=(0.26862954, 0.26130258, 0.27577711), rescale_factor=1 / 255):
+        self.shortest_edge = int(shortest_edge)
+        self.crop_height, self.crop_width = (int(v) for v in crop_size)
+        if min(self.crop_height, self.crop_width) > self.shortest_edge:
+            raise ValueError("Crop size larger than the resized shortest edge needs padding, which is not supported.")
+        mean = torch.tensor(image_mean, dtype=torch.float32)
+        std = torch.tensor(image_std, dtype=torch.float32)
+        # (x * rescale - mean) / std == x * scale - shift
+        self._scale = (rescale_factor / std).view(1, 3, 1, 1)
+        self._shift = (mean / std).view(1, 3, 1, 1)
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # Per-thread buffers are scratch space: copies and pickles start without them
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @classmethod
+    def from_image_processor(cls, processor):
+        """Build from a CLIPProcessor or CLIPImageProcessor. Raises ValueError for configurations it cannot reproduce."""
+        processor = getattr(processor, "image_processor", processor)
+        size = processor.size if isinstance(processor.size, dict) else {"shortest_edge": processor.size}
+        crop = processor.crop_size if isinstance(processor.crop_size, dict) else {"height": processor.crop_size, "width": processor.crop_size}
+        if not (processor.do_resize and processor.do_center_crop and processor.do_rescale and processor.do_normalize) or "shortest_edge" not in size:
+            raise ValueError("Only shortest-edge resize + center crop + rescale + normalize is supported.")
+        return cls(size["shortest_edge"], (crop["height"], crop["width"]), processor.image_mean, processor.image_std, processor.rescale_factor)
+
+    @staticmethod
+    def supports(image):
+        return isinstance(image, np.ndarray) and image.dtype == np.uint8 and (image.ndim == 2 or (image.ndim == 3 and image.shape[2] in (3, 4)))
+
+    def _buffer(self, name, shape, dtype, pin=False):
+        """Per-thread buffer with room for at least shape[0] items, grown when a bigger batch arrives."""
+        buffer = getattr(self._local, name, None)
+        if buffer is None or buffer.shape[0] < shape[0]:
+            if dtype is np.uint8:
+                buffer = np.empty(shape, dtype=np.uint8)
+            else:
+                buffer = torch.empty(shape, dtype=dtype, pin_memory=pin)
+            setattr(self._local, name, buffer)
+        return buffer[:shape[0]]
+
+    def _resize_crop(self, frame, out):
+        if frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        elif frame.shape[2] == 4:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+        height, width = frame.shape[:2]
+        # Same rounding as transformers' get_resize_output_image_size(default_to_square=False)
+        if width <= height:
+            new_width, new_height = self.shortest_edge, int(self.shortest_edge * height / width)
+        else:
+            new_width, new_height = int(self.shortest_edge * width / height), self.shortest_edge
+        if (new_width, new_height) != (width, height):
+            # Near 1x, PIL's antialiased bicubic is still close to plain bicubic; further down it is closer to INTER_AREA
+            interpolation = cv2.INTER_AREA if new_width < 0.85 * width else cv2.INTER_CUBIC
+            frame = cv2.resize(frame, (new_width, new_height), interpolation=interpolation)
+        top = (new_height - self.crop_height) // 2
+        left = (new_width - self.crop_width) // 2
+        out[...] = frame[top:top + self.crop_height, left:left + self.crop_width]
+
+    def __call__(self, frames, reuse=False, device=None):
+        """
+        (N, 3, crop_height, crop_width) float32 pixel_values for a list of BGR (or gray/BGRA) uint8 frames.
+        With `reuse`, the result is a view of a per-thread tensor that the next reuse=True call on the same
+        thread overwrites; only use it when the batch is consumed before then. Results on a CUDA `device`
+        are always fresh, since the host buffer is copied out before it is reused.
+        """
+        count = len(frames)
+        staging = self._buffer("staging", (count, self.crop_height, self.crop_width, 3), np.uint8)
+        for frame, out in zip(frames, staging):
+            self._resize_crop(frame, out)
+
+        on_gpu = device is not None and torch.device(device).type == "cuda"
+        shape = (count, 3, self.crop_height, self.crop_width)
+        if reuse or on_gpu:
+            pixel_values = self._buffer("pixel_values", shape, torch.float32, pin=on_gpu)
+        else:
+            pixel_values = torch.empty(shape, dtype=torch.float32)
+        pixels = torch.from_numpy(staging)
+        for channel in range(3): # BGR -> RGB while converting HWC uint8 to CHW float
+            pixel_values[:, channel].copy_(pixels[..., 2 - channel])
+        pixel_values.mul_(self._scale).sub_(self._shift)
+        return pixel_values.to(device) if device is not None else pixel_values
+
 class FewShotFineTunedCLIP:
-    def __init__(self, model_path=None, model_name="openai/clip-vit-base-patch32"):
+    def __init__(self, model_path=None, model_name="openai/clip-vit-base-patch32", backend="torch", export_dir=CLIP_EXPORT_DIR, quantize=False, inference_only=False):
+        if backend not in CLIP_BACKENDS:
+            raise ValueError(f"Unknown CLIP backend '{backend}'. Expected one of {CLIP_BACKENDS}.")
         self.device = device
-        self.processor = CLIPProcessor.from_pretrained(model_name)
+        self.backend = backend
+        self.quantized = False
+        self.model_name = model_name
+        self.text_checkpoint = model_path # Where fine-tuned text tower weights come from when it has to be reloaded
+        # Zero-shot classes and their prompts. Registered classes are appended, so the first
+        # len(crime_classes) indices always line up with the fine-tuned head's outputs.
+        self.class_names = list(crime_classes)
+        self.prompts = dict(few_shot_crime_prompts)
+        self._prompt_lock = threading.Lock()
+        self.slim = backend == "torch" and is_slim_checkpoint(model_path)
+        if backend == "torch":
+            if self.slim:
+                # Everything needed is inside the checkpoint: no Hugging Face download or full CLIPModel init
+                self._init_slim(model_path)
+            else:
+                self.processor = CLIPProcessor.from_pretrained(model_name)
+                self._init_eager(model_path, model_name)
+            if quantize:
+                self.quantize_int8()
+            if inference_only:
+                self.release_text_tower()
+        else:
+            self.processor = CLIPProcessor.from_pretrained(model_name)
+            self._init_exported(export_dir)
+        try:
+            self.frame_preprocessor = FramePreprocessor.from_image_processor(self.processor)
+        except ValueError as e:
+            print(f"⚠️ Fast frame preprocessing unavailable, using CLIPProcessor for every input: {e}")
+            self.frame_preprocessor = None
+
+    def __getstate__(self):
+        # Locks cannot be copied or pickled; copy.deepcopy (e.g. clip_quantization_eval.py) gets a fresh one
+        state = self.__dict__.copy()
+        del state["_prompt_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._prompt_lock = threading.Lock()
+
+    def _init_eager(self, model_path, model_name):
         self.model = CLIPModel.from_pretrained(model_name).to(device)
         
         # Lightweight classification head (matching training)
-        self.classifier = nn.Sequential(
-            nn.Dropout(0.3),
-            nn.Linear(self.model.config.projection_dim, 512),
-            nn.ReLU(),
-            nn.BatchNorm1d(512),
-            nn.Dropout(0.2),
-            nn.Linear(512, len(crime_classes))
-        ).to(device)
+        self.classifier = build_classifier_head(self.model.config.projection_dim).to(device)
         
         # Load few-shot fine-tuned weights if available
         if model_path and os.path.exists(model_path):
@@ -94,17 +264,223 @@ class FewShotFineTunedCLIP:
         self.model.eval()
         self.classifier.eval()
 
+        # Prompts never change at serving time, so encode them once up front
+        self.cache_prompt_embeddings()
+
+    def cache_prompt_embeddings(self):
+        """Run the text tower once over the crime prompts and keep the normalized embeddings."""
+        self.text_embeds = self.encode_prompts([self.prompts[name] for name in self.class_names])
+        self.logit_scale = self.model.logit_scale.exp().item()
+
+    def has_text_tower(self):
+        return self.backend == "torch" and not self.slim and self.model.text_model is not None
+
+    def release_text_tower(self):
+        """
+        Inference-only mode: drop the text encoder and text projection once the prompts are cached.
+        Only the vision path and the small text_embeds matrix stay resident; register_prompts()
+        reloads the text tower temporarily when new prompts need encoding.
+        """
+        if not self.has_text_tower():
+            return
+        self.model.text_model = None
+        self.model.text_projection = None
+        gc.collect()
+        if self.device.type == "cuda":
+            torch.cuda.empty_cache()
+        print("🧹 CLIP text tower released (inference-only mode).")
+
+    def _load_text_tower(self):
+        """Standalone text encoder + tokenizer, with the fine-tuned text weights from text_checkpoint when available."""
+        from transformers import CLIPTextModelWithProjection, CLIPTokenizer
+
+        print(f"🔍 Temporarily loading the CLIP text tower ({self.model_name})...")
+        text_model = CLIPTextModelWithProjection.from_pretrained(self.model_name)
+        if self.text_checkpoint and os.path.exists(self.text_checkpoint) and not is_slim_checkpoint(self.text_checkpoint):
+            checkpoint = torch.load(self.text_checkpoint, map_location="cpu", mmap=True)
+            text_state = {
+                name: tensor for name, tensor in checkpoint["model_state_dict"].items()
+                if name.startswith(("text_model.", "text_projection."))
+            }
+            text_model.load_state_dict(text_state, strict=False)
+            del checkpoint
+        elif self.use_finetuned:
+            print("⚠️ Fine-tuned text weights not found; encoding new prompts with the pretrained text tower.")
+        return text_model.to(self.device).eval(), CLIPTokenizer.from_pretrained(self.model_name)
+
+    def encode_prompts(self, prompts):
+        """Normalized text embeddings for a list of prompts, loading the text tower temporarily if it was released."""
+        with torch.no_grad():
+            if self.has_text_tower():
+                text_inputs = self.processor(text=prompts, return_tensors="pt", padding=True).to(self.device)
+                text_features = self.model.get_text_features(**text_inputs)
+            else:
+                text_model, tokenizer = self._load_text_tower()
+                text_inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+                text_features = text_model(**text_inputs).text_embeds
+                del text_model
+                gc.collect()
+                if self.device.type == "cuda":
+                    torch.cuda.empty_cache()
+        return text_features / text_features.norm(dim=-1, keepdim=True)
+
+    def register_prompts(self, prompts):
+        """
+        Add classes or replace the prompts of existing ones, given {class_name: prompt}.
+        New classes take part in zero-shot classification only; the fine-tuned head still predicts
+        the classes it was trained on. Returns the updated class list.
+        """
+        with self._prompt_lock:
+            updated = {**self.prompts, **prompts}
+            class_names = self.class_names + [name for name in prompts if name not in self.prompts]
+            text_embeds = self.text_embeds.clone()
+            new_embeds = self.encode_prompts(list(prompts.values())).to(text_embeds.dtype)
+            new_rows = []
+            for name, embed in zip(prompts, new_embeds):
+                if name in self.prompts:
+                    text_embeds[self.class_names.index(name)] = embed
+                else:
+                    new_rows.append(embed)
+            if new_rows:
+                text_embeds = torch.cat([text_embeds, torch.stack(new_rows)])
+            # Readers index class_names with argmax over text_embeds, so grow the name list first
+            self.prompts = updated
+            self.class_names = class_names
+            self.text_embeds = text_embeds
+        print(f"✅ Registered prompts for: {', '.join(prompts)}")
+        return list(class_names)
+
+    def quantize_int8(self):
+        """
+        Opt-in CPU speedup: dynamic INT8 quantization of the Linear layers in the vision encoder,
+        visual projection and classifier head. The text tower is untouched (prompts are already cached).
+        Check verdicts with clip_quantization_eval.py before enabling it in production.
+        """
+        if self.backend != "torch" or self.quantized:
+            return
+        if self.device.type != "cpu":
+            print("⚠️ Dynamic INT8 quantization only runs on CPU; keeping the fp32 model.")
+            return
+        qconfig = torch.ao.quantization.default_dynamic_qconfig
+        # Only Linear layers: the patch/position embeddings stay fp32 (dynamic quantization does not support them)
+        torch.ao.quantization.quantize_dynamic(
+            self.model, {"vision_model": qconfig, "vision_model.embeddings": None, "visual_projection": qconfig},
+            dtype=torch.qint8, inplace=True
+        )
+        self.classifier = torch.ao.quantization.quantize_dynamic(self.classifier, {nn.Linear}, dtype=torch.qint8)
+        self.quantized = True
+        print("✅ CLIP vision encoder and classifier head quantized to INT8 (dynamic).")
+
+    def _init_slim(self, model_path):
+        """
+        Load a slim checkpoint written by clip_slim_checkpoint.py: vision tower, visual projection,
+        classifier head and cached prompt embeddings. safetensors memory-maps the file, and the
+        weights are assigned in place rather than copied over a randomly initialized model.
+        """
+        from safetensors import safe_open
+        from safetensors.torch import load_file
+
+        print(f"🔍 Loading slim CLIP checkpoint from: {model_path}")
+        with safe_open(model_path, framework="pt") as f:
+            meta = f.metadata() or {}
+        if meta.get("format") != CLIP_SLIM_FORMAT:
+            raise ValueError(f"{model_path} is not a slim CLIP checkpoint (format: {meta.get('format')}).")
+        saved_classes = json.loads(meta["crime_classes"])
+        if saved_classes[:len(crime_classes)] != crime_classes:
+            raise ValueError(f"Class list in {model_path} does not match crime_classes; re-run clip_slim_checkpoint.py.")
+        tensors = load_file(model_path, device="cpu")
+
+        config = CLIPVisionConfig.from_dict(json.loads(meta["vision_config"]))
+        with no_init_weights():
+            self.model = CLIPVisionModelWithProjection(config)
+        self.model.load_state_dict(_strip_prefix(tensors, "model."), assign=True)
+        self.model.to(device).eval()
+        self.classifier = build_classifier_head(config.projection_dim)
+        self.classifier.load_state_dict(_strip_prefix(tensors, "classifier."), assign=True)
+        self.classifier.to(device).eval()
+
+        self.processor = CLIPImageProcessor.from_dict(json.loads(meta["image_processor"]))
+        self.text_embeds = tensors["text_embeds"].to(device)
+        self.logit_scale = float(meta["logit_scale"])
+        self.use_finetuned = meta.get("use_finetuned") == "true"
+        self.class_names = saved_classes
+        self.prompts = json.loads(meta["prompts"])
+        self.model_name = meta.get("model_name", self.model_name)
+        # The slim file has no text tower; registering prompts reloads it from the original checkpoint if it is alongside
+        self.text_checkpoint = os.path.join(os.path.dirname(model_path), meta.get("source_checkpoint", ""))
+        print(f"✅ Slim CLIP checkpoint loaded ({'fine-tuned' if self.use_finetuned else 'zero-shot'})")
+
+    def _init_exported(self, export_dir):
+        """Load the exported vision tower + head and the prompt embeddings written by clip_export.py."""
+        self.model = None
+        self.classifier = None
+        meta = np.load(os.path.join(export_dir, CLIP_EXPORT_FILES["metadata"]))
+        self.text_embeds = torch.from_numpy(meta["text_embeds"]).to(device)
+        self.logit_scale = float(meta["logit_scale"])
+        self.use_finetuned = bool(meta["use_finetuned"])
+        self.class_names = [str(name) for name in meta["crime_classes"]]
+        self.prompts = dict(zip(self.class_names, (str(prompt) for prompt in meta["prompts"])))
+        self.text_checkpoint = None
+
+        graph_path = os.path.join(export_dir, CLIP_EXPORT_FILES[self.backend])
+        print(f"🔍 Loading exported CLIP vision graph ({self.backend}) from: {graph_path}")
+        if self.backend == "torchscript":
+            self.graph = torch.jit.load(graph_path, map_location=device).eval()
+        else:
+            try:
+                import onnxruntime as ort
+            except ImportError as e:
+                raise ImportError("The onnxruntime backend requires the 'onnxruntime' package (uv sync --extra onnx).") from e
+            self.graph = ort.InferenceSession(graph_path, providers=ort.get_available_providers())
+
+    def _run_exported(self, pixel_values):
+        """Run the exported graph. Returns (normalized image embeddings, classifier-head logits)."""
+        if self.backend == "torchscript":
+            with torch.no_grad():
+                return self.graph(pixel_values)
+        image_embeds, logits = self.graph.run(None, {"pixel_values": pixel_values.cpu().numpy()})
+        return torch.from_numpy(image_embeds).to(device), torch.from_numpy(logits).to(device)
+
+    def encode_images(self, pixel_values):
+        """Image-only forward. Returns L2-normalized embeddings, same as CLIPModel's image_embeds."""
+        if self.backend != "torch":
+            return self._run_exported(pixel_values)[0]
+        with torch.no_grad():
+            if self.slim:
+                image_features = self.model(pixel_values=pixel_values).image_embeds
+            else:
+                image_features = self.model.get_image_features(pixel_values=pixel_values)
+        return image_features / image_features.norm(dim=-1, keepdim=True)
+
+    def head_logits(self, pixel_values):
+        """Fine-tuned classification-head logits for a batch of preprocessed images."""
+        return self.forward_images(pixel_values)[1]
+
+    def forward_images(self, pixel_values):
+        """One vision forward. Returns (normalized image embeddings, classifier-head logits)."""
+        if self.backend != "torch":
+            return self._run_exported(pixel_values)
+        image_embeds = self.encode_images(pixel_values)
+        with torch.no_grad():
+            return image_embeds, self.classifier(image_embeds)
+
+def _strip_prefix(tensors, prefix):
+    return {name[len(prefix):]: tensor for name, tensor in tensors.items() if name.startswith(prefix)}
+
 # Global models
 clip_classifier = None
 # vit_model removed
 
-def load_models(clip_checkpoint="clip_finetuned_few_shot.pth"): # vit_checkpoint removed
+def load_models(clip_checkpoint="clip_finetuned_few_shot.pth", backend="torch", export_dir=CLIP_EXPORT_DIR, quantize=False, inference_only=False): # vit_checkpoint removed
+    """Load the CLIP classifier. backend is "torch" (eager; a .safetensors clip_checkpoint is a slim checkpoint from clip_slim_checkpoint.py), or "torchscript"/"onnxruntime" to use the graphs written by clip_export.py."""
     global clip_classifier
     
-    print(f"🔍 Loading CLIP model...")
+    print(f"🔍 Loading CLIP model (backend: {backend})...")
     
     # Load few-shot CLIP classifier
-    clip_classifier = FewShotFineTunedCLIP(model_path=clip_checkpoint)
+    clip_classifier = FewShotFineTunedCLIP(
+        model_path=clip_checkpoint, backend=backend, export_dir=export_dir, quantize=quantize, inference_only=inference_only
+    )
     
     # ViT model loading removed
     
@@ -117,7 +493,7 @@ def load_models(clip_checkpoint="clip_finetuned_few_shot.pth"): # vit_checkpoint
 
 
 def calculate_frame_difference(frame1, frame2, threshold=30):
-    """Calculate if two frames are significantly different."""
+    """Calculate if two frames are significantly different (full-resolution mean absdiff; see FrameDeduplicator)."""
     if frame1 is None or frame2 is None:
         return True # Treat as different if one is missing
     
@@ -136,89 +512,222 @@ def calculate_frame_difference(frame1, frame2, threshold=30):
     mean_diff = np.mean(diff)
     return mean_diff > threshold
 
-def extract_frames(video_path, output_folder=FRAME_FOLDER, min_frame_diff=30, max_frames=50):
-    """Extract frames from video with intelligent frame selection."""
+class FrameDeduplicator:
+    """
+    Near-duplicate frame filter based on 64-bit difference hashes (dHash) of tiny grayscale thumbnails.
+    A frame is a duplicate if its hash is within `max_hash_distance` bits of any of the last `window`
+    kept frames, so an A-B-A scene cut does not send A to CLIP twice. A negative distance disables it.
+    """
+
+    def __init__(self, window=FRAME_DEDUP_WINDOW, max_hash_distance=FRAME_DEDUP_MAX_DISTANCE, hash_size=8):
+        self.window = max(1, int(window))
+        self.max_hash_distance = max_hash_distance
+        self.hash_size = hash_size
+        self.recent_hashes = deque(maxlen=self.window)
+        self.frames_seen = 0
+        self.frames_skipped = 0
+
+    def frame_hash(self, frame):
+        """dHash: sign of horizontal gradients on a (hash_size+1) x hash_size thumbnail, packed into an int."""
+        # Downscale first so the color conversion only touches a few dozen pixels
+        thumb = cv2.resize(frame, (self.hash_size + 1, self.hash_size), interpolation=cv2.INTER_AREA)
+        if thumb.ndim == 3:
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+        bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+        return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+    def is_duplicate(self, frame):
+        """Check `frame` against the window; frames that are not duplicates are added to it."""
+        self.frames_seen += 1
+        if self.max_hash_distance is None or self.max_hash_distance < 0:
+            return False
+        frame_hash = self.frame_hash(frame)
+        if any((frame_hash ^ kept).bit_count() <= self.max_hash_distance for kept in self.recent_hashes):
+            self.frames_skipped += 1
+            return True
+        self.recent_hashes.append(frame_hash)
+        return False
+
+def frame_filename(frame_number):
+    """File name used for a sampled frame, whether or not it is written to disk."""
+    return f"frame_{frame_number:05d}.jpg"
+
+def iter_frames(video, max_frames=50, seek=False, deduplicator=None):
+    """
+    Stream sampled frames from a video as (frame_number, BGR ndarray) pairs, without touching disk.
+    `video` is a path or an already-open cv2.VideoCapture (left open for the caller).
+    Frames between samples are only grab()bed, never decoded; with seek=True the capture
+    jumps straight to each sampled index instead, which is faster on long, seekable files.
+    Near-duplicate frames are dropped by `deduplicator` (a default FrameDeduplicator if None).
+    """
+    if deduplicator is None:
+        deduplicator = FrameDeduplicator()
+    skipped_before = deduplicator.frames_skipped
+    owns_capture = not isinstance(video, cv2.VideoCapture)
+    cap = cv2.VideoCapture(video) if owns_capture else video
+    try:
+        if not cap.isOpened():
+            print(f"❌ Error: Could not open video {video}")
+            return
+
+        total_frames_vid = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total_frames_vid <= 0: # Handle videos with no frames or invalid frame count
+            print(f"⚠️ Video {video} has no frames or an invalid frame count.")
+            return
+
+        # Calculate frame sampling rate based on max_frames desired
+        if max_frames > 0 and total_frames_vid > max_frames:
+            frame_interval = total_frames_vid // max_frames
+        else:
+            frame_interval = 1 # Process all frames or up to total_frames_vid if less than max_frames
+
+        frames_kept = 0
+
+        for frame_number in range(0, total_frames_vid, frame_interval):
+            if seek:
+                if frame_number > 0 and frame_interval > 1:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+                ret, frame = cap.read()
+            else:
+                # Skip to the sampled frame by grabbing (demux only) the ones in between
+                skipped_ok = True
+                for _ in range(frame_interval - 1 if frame_number > 0 else 0):
+                    if not cap.grab():
+                        skipped_ok = False
+                        break
+                ret, frame = cap.read() if skipped_ok else (False, None)
+            if not ret:
+                break # End of video
+
+            # Skip frames that look like one we kept recently
+            if deduplicator.is_duplicate(frame):
+                continue
+
+            frames_kept += 1
+            yield frame_number, frame
+
+            # Stop once we've sampled enough frames (if max_frames is set and positive)
+            if max_frames > 0 and frames_kept >= max_frames:
+                break
+    finally:
+        metrics.FRAMES_SKIPPED.inc(deduplicator.frames_skipped - skipped_before)
+        if owns_capture:
+            cap.release()
+
+def iter_stream_frames(stream, max_frames=50, sample_interval_s=1.0, max_duration_s=None, deduplicator=None):
+    """
+    Like iter_frames, but for a non-seekable file-like `stream` (e.g. an UploadPipe) decoded with PyAV
+    as bytes arrive. When the container reports its duration, max_frames are spread over it as
+    iter_frames does; otherwise (e.g. piped MPEG-TS) a frame is sampled every `sample_interval_s`
+    seconds of video up to the end of the stream, with no max_frames cap, so long videos are covered whole.
+    Only sampled frames are converted to BGR ndarrays. Raises VideoLimitExceeded past `max_duration_s`.
+    MP4s must have their index up front (ffmpeg -movflags +faststart); streaming formats such as
+    MPEG-TS, MKV and fragmented MP4 always work.
+    """
+    try:
+        import av
+    except ImportError as e:
+        raise ImportError("Streaming video decoding requires the 'av' (PyAV) package.") from e
+    from upload_pipe import VideoLimitExceeded
+
+    if deduplicator is None:
+        deduplicator = FrameDeduplicator()
+    skipped_before = deduplicator.frames_skipped
+    try:
+        container = av.open(stream, mode="r")
+    except Exception as e:
+        raise ValueError(f"Could not open the video stream ({e}). MP4 uploads need +faststart to be decoded while uploading.") from e
+    try:
+        if not container.streams.video:
+            raise ValueError("The upload has no video stream.")
+        video_stream = container.streams.video[0]
+        video_stream.thread_type = "AUTO"
+        duration_s = container.duration / av.time_base if container.duration else None
+        if max_duration_s and duration_s and duration_s > max_duration_s:
+            raise VideoLimitExceeded(f"Video is {duration_s:.0f}s long; the limit is {max_duration_s:.0f}s.")
+        interval_s = duration_s / max_frames if duration_s and max_frames > 0 else sample_interval_s
+        fallback_fps = float(video_stream.average_rate or 25)
+
+        first_time = None
+        next_sample_s = 0.0
+        frames_kept = 0
+        for frame_number, frame in enumerate(container.decode(video_stream)):
+            frame_time = frame.time if frame.time is not None else frame_number / fallback_fps
+            if first_time is None:
+                first_time = frame_time
+            elapsed_s = frame_time - first_time
+            if max_duration_s and elapsed_s > max_duration_s:
+                raise VideoLimitExceeded(f"Video is longer than the {max_duration_s:.0f}s limit.")
+            if elapsed_s < next_sample_s:
+                continue # Decoded (inter frames need it) but never converted
+            next_sample_s += interval_s * max(1, int((elapsed_s - next_sample_s) // interval_s) + 1)
+
+            image = frame.to_ndarray(format="bgr24")
+            if deduplicator.is_duplicate(image):
+                continue
+            frames_kept += 1
+            yield frame_number, image
+            if duration_s and max_frames > 0 and frames_kept >= max_frames:
+                break
+    finally:
+        metrics.FRAMES_SKIPPED.inc(deduplicator.frames_skipped - skipped_before)
+        container.close()
+
+def extract_frames(video_path, output_folder=FRAME_FOLDER, max_frames=50, seek=False, deduplicator=None):
+    """Extract frames from video with intelligent frame selection and save them as JPEGs."""
     print(f"📽 Processing video: {video_path}")
     
     video_name = os.path.splitext(os.path.basename(video_path))[0]
     # Frames will be saved in output_folder/video_name/
     frames_subfolder = os.path.join(output_folder, video_name)
     os.makedirs(frames_subfolder, exist_ok=True)
-    
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"❌ Error: Could not open video {video_path}")
-        return []
-    
-    total_frames_vid = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    # fps = int(cap.get(cv2.CAP_PROP_FPS)) # fps not used in current logic
-
-    if total_frames_vid <= 0 : # Handle videos with no frames or invalid frame count
-        print(f"⚠️ Video {video_path} has no frames or an invalid frame count.")
-        cap.release()
-        return []
-
-    # Calculate frame sampling rate based on max_frames desired
-    if max_frames > 0 and total_frames_vid > max_frames:
-        frame_interval = total_frames_vid // max_frames
-    else:
-        frame_interval = 1 # Process all frames or up to total_frames_vid if less than max_frames
-    
-    if frame_interval == 0: frame_interval = 1 # Ensure interval is at least 1
 
     saved_frame_paths = []
-    last_saved_cv2_frame = None
-    frame_count_processed = 0
-    
-    with tqdm(total=total_frames_vid, desc=f"Extracting frames from {video_name}") as pbar:
-        while cap.isOpened():
-            ret, cv2_frame = cap.read()
-            if not ret:
-                break # End of video
-                
-            if frame_count_processed % frame_interval == 0:
-                # Check if frame is significantly different from last saved frame
-                if last_saved_cv2_frame is None or calculate_frame_difference(cv2_frame, last_saved_cv2_frame, min_frame_diff):
-                    frame_filename = f"frame_{frame_count_processed:05d}.jpg"
-                    frame_path = os.path.join(frames_subfolder, frame_filename)
-                    cv2.imwrite(frame_path, cv2_frame)
-                    saved_frame_paths.append(frame_path)
-                    last_saved_cv2_frame = cv2_frame.copy() # Keep a copy of the last saved frame
-                    
-                    # Break if we've extracted enough frames (if max_frames is set and positive)
-                    if max_frames > 0 and len(saved_frame_paths) >= max_frames:
-                        break
-            
-            frame_count_processed += 1
-            pbar.update(1)
-    
-    cap.release()
+    frames = iter_frames(video_path, max_frames=max_frames, seek=seek, deduplicator=deduplicator)
+    for frame_number, cv2_frame in tqdm(frames, desc=f"Extracting frames from {video_name}"):
+        frame_path = os.path.join(frames_subfolder, frame_filename(frame_number))
+        cv2.imwrite(frame_path, cv2_frame)
+        saved_frame_paths.append(frame_path)
+
     print(f"✅ Extracted {len(saved_frame_paths)} frames for analysis from {video_name} into {frames_subfolder}")
     return saved_frame_paths
 
 # get_evidence_predictions function removed as it was ViT specific
 
+def _few_shot_finetuned_probs(pixel_values):
+    """Class probabilities from the fine-tuned head for a batch of preprocessed images."""
+    with torch.no_grad():
+        logits = clip_classifier.head_logits(pixel_values)
+        return torch.softmax(logits, dim=1)
+
+def _zeroshot_probs(pixel_values):
+    """Zero-shot class probabilities for a batch of preprocessed images."""
+    with torch.no_grad():
+        image_features = clip_classifier.encode_images(pixel_values)
+        # Same as CLIPModel's logits_per_image, but against the cached prompt embeddings
+        logits = clip_classifier.logit_scale * image_features @ clip_classifier.text_embeds.t()
+        return logits.softmax(dim=1)
+
+def _crime_probs(pixel_values):
+    """
+    Dispatch to the fine-tuned or zero-shot head from a single vision forward.
+    Returns (probs, model_type, normalized image embeddings).
+    """
+    image_embeds, head_logits = clip_classifier.forward_images(pixel_values)
+    with torch.no_grad():
+        if clip_classifier.use_finetuned:
+            return torch.softmax(head_logits, dim=1), "clip-few-shot-finetuned", image_embeds
+        logits = clip_classifier.logit_scale * image_embeds @ clip_classifier.text_embeds.t()
+        return logits.softmax(dim=1), "clip-zero-shot", image_embeds
+
 def predict_with_few_shot_finetuned(image_pil):
     """Use few-shot fine-tuned CLIP for crime classification. Expects PIL image."""
-    if not clip_classifier or not clip_classifier.processor or not clip_classifier.model or not clip_classifier.classifier:
+    if not clip_classifier or not clip_classifier.processor:
         print("❌ CLIP model or components not initialized for few-shot prediction.")
         return "Error", 0.0
 
-    prompts = list(few_shot_crime_prompts.values())
-    
-    inputs = clip_classifier.processor(
-        text=prompts,
-        images=image_pil,
-        return_tensors="pt",
-        padding=True
-    ).to(device)
-    
-    with torch.no_grad():
-        outputs = clip_classifier.model(**inputs)
-        image_features = outputs.image_embeds
-        
-        logits = clip_classifier.classifier(image_features)
-        probs = torch.softmax(logits, dim=1)
+    inputs = clip_classifier.processor(images=image_pil, return_tensors="pt").to(device)
+    probs = _few_shot_finetuned_probs(inputs["pixel_values"])
     
     crime_idx = torch.argmax(probs, dim=1).item()
     predicted_crime = crime_classes[crime_idx]
@@ -228,72 +737,180 @@ def predict_with_few_shot_finetuned(image_pil):
 
 def predict_with_zeroshot_clip(image_pil):
     """Fallback to zero-shot CLIP. Expects PIL image."""
-    if not clip_classifier or not clip_classifier.processor or not clip_classifier.model:
+    if not clip_classifier or not clip_classifier.processor:
         print("❌ CLIP model or components not initialized for zero-shot prediction.")
         return "Error", 0.0
 
-    prompts = list(few_shot_crime_prompts.values())
-    
-    inputs = clip_classifier.processor(
-        text=prompts,
-        images=image_pil,
-        return_tensors="pt",
-        padding=True
-    ).to(device)
-    
-    with torch.no_grad():
-        outputs = clip_classifier.model(**inputs)
-        # For zero-shot, logits_per_image directly gives similarity scores between image and text prompts
-        probs = outputs.logits_per_image.softmax(dim=1) 
+    inputs = clip_classifier.processor(images=image_pil, return_tensors="pt").to(device)
+    probs = _zeroshot_probs(inputs["pixel_values"])
     
     crime_idx = torch.argmax(probs, dim=1).item()
-    predicted_crime = crime_classes[crime_idx]
+    predicted_crime = clip_classifier.class_names[crime_idx]
     crime_conf = round(probs[0][crime_idx].item(), 3)
     
     return predicted_crime, crime_conf
 
-def predict_single_image(image_path):
-    """Predict crime type from a single image using CLIP."""
+def _image_name(image, index, image_names=None):
+    """Name reported for an input: the caller's name, the file name for paths, or a positional label."""
+    if image_names is not None:
+        return image_names[index]
+    if isinstance(image, (str, os.PathLike)):
+        return os.path.basename(image)
+    return f"image_{index:05d}"
+
+def _load_clip_input(image):
+    """
+    Turn a path, PIL image or OpenCV ndarray (BGR or grayscale) into an RGB PIL image for CLIPProcessor.
+    Only paths touch the filesystem; in-memory inputs are converted without re-encoding.
+    Ndarrays always mean BGR, so the result is a PIL image and can never be mistaken for one.
+    """
+    if isinstance(image, (str, os.PathLike)):
+        return Image.open(image).convert("RGB")
+    if isinstance(image, Image.Image):
+        return image if image.mode == "RGB" else image.convert("RGB")
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2:
+            return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_GRAY2RGB))
+        if image.ndim == 3 and image.shape[2] == 3:
+            return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        if image.ndim == 3 and image.shape[2] == 4:
+            return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGRA2RGB))
+        raise ValueError(f"Unsupported ndarray shape for CLIP input: {image.shape}")
+    raise TypeError(f"Unsupported CLIP input type: {type(image).__name__}")
+
+def _predict_micro_batch(images, image_names, with_embeddings=False):
+    """Load, preprocess and classify one micro-batch with a single CLIP forward."""
+    results = [None] * len(images)
+    loaded = [] # (index in batch, BGR ndarray or RGB PIL image) for every input that loaded cleanly
+
+    for i, image in enumerate(images):
+        try:
+            # Frames FramePreprocessor can take stay BGR ndarrays; preprocess_images converts the rest
+            loaded.append((i, image if FramePreprocessor.supports(image) else _load_clip_input(image)))
+        except FileNotFoundError:
+            print(f"❌ [ERROR] Image file not found: {image}")
+            results[i] = {"image_name": image_names[i], "error": f"File not found: {image}"}
+        except Exception as e:
+            print(f"❌ [ERROR] Failed on {image_names[i]}: {e}")
+            results[i] = {"image_name": image_names[i], "error": str(e)}
+
+    if not loaded:
+        return results
+
+    try:
+        # Consumed by classify_pixel_values before this thread preprocesses again, so the buffer can be reused
+        pixel_values = preprocess_images([img for _, img in loaded], reuse=True)
+        predictions = classify_pixel_values(pixel_values, [image_names[i] for i, _ in loaded], with_embeddings)
+        for (i, _), prediction in zip(loaded, predictions):
+            results[i] = prediction
+    except Exception as e:
+        metrics.MODEL_ERRORS.inc(stage="clip")
+        print(f"❌ [ERROR] CLIP batch of {len(loaded)} images failed: {e}")
+        for i, _ in loaded:
+            results[i] = {"image_name": image_names[i], "error": str(e)}
+
+    return results
+
+def preprocess_images(images, reuse=False, fast=None):
+    """
+    Turn a list of inputs (paths, PIL images or BGR ndarrays) into pixel_values on device.
+    Batches made only of uint8 ndarrays take the FramePreprocessor path (when `fast`, default
+    CLIP_FAST_PREPROCESS); anything else goes through CLIPProcessor. `reuse`: see FramePreprocessor.
+    """
+    fast = CLIP_FAST_PREPROCESS if fast is None else fast
+    with metrics.CLIP_PREPROCESS_SECONDS.time():
+        frame_preprocessor = getattr(clip_classifier, "frame_preprocessor", None)
+        if fast and frame_preprocessor and images and all(FramePreprocessor.supports(image) for image in images):
+            return frame_preprocessor(images, reuse=reuse, device=device)
+        rgb_images = [_load_clip_input(image) for image in images]
+        return clip_classifier.processor(images=rgb_images, return_tensors="pt")["pixel_values"].to(device)
+
+def check_preprocess_parity(frames, processor=None, mean_tolerance=0.02, max_tolerance=0.35):
+    """
+    Compare preprocess_images on BGR frames against CLIPProcessor on the same frames as RGB PIL images.
+    Returns the mean and max absolute difference in normalized pixel units (1 grey level is about 0.015)
+    and whether both are within tolerance. Uses the loaded classifier's processor unless one is given.
+    """
+    processor = processor if processor is not None else clip_classifier.processor
+    expected = processor(images=[_load_clip_input(frame) for frame in frames], return_tensors="pt")["pixel_values"]
+    if processor is getattr(clip_classifier, "processor", None):
+        actual = preprocess_images(frames, fast=True).cpu()
+    else:
+        actual = FramePreprocessor.from_image_processor(processor)(frames)
+    diff = (actual - expected).abs()
+    mean_diff, max_diff = diff.mean().item(), diff.max().item()
+    return {
+        "frames": len(frames),
+        "shape_match": tuple(actual.shape) == tuple(expected.shape),
+        "mean_abs_diff": round(mean_diff, 5),
+        "max_abs_diff": round(max_diff, 5),
+        "ok": tuple(actual.shape) == tuple(expected.shape) and mean_diff <= mean_tolerance and max_diff <= max_tolerance,
+    }
+
+def classify_pixel_values(pixel_values, image_names, with_embeddings=False):
+    """
+    Classify an already-preprocessed batch in one forward. Returns one prediction dict per image.
+    With `with_embeddings`, each dict also carries its normalized image embedding (float32 ndarray)
+    under "embedding"; callers must pop it before the dict is serialized.
+    """
+    with metrics.CLIP_FORWARD_SECONDS.time():
+        probs, model_type, image_embeds = _crime_probs(pixel_values)
+        crime_confs, crime_idxs = probs.max(dim=1)
+    predictions = [{
+        "image_name": image_name,
+        "predicted_class": clip_classifier.class_names[crime_idx],
+        "crime_confidence": round(crime_conf, 3),
+        "model_type": model_type,
+        "analysis_mode": "single_image_clip_only"
+    } for image_name, crime_conf, crime_idx in zip(image_names, crime_confs.tolist(), crime_idxs.tolist())]
+    if with_embeddings:
+        for prediction, embedding in zip(predictions, image_embeds.float().cpu().numpy()):
+            prediction["embedding"] = embedding
+    return predictions
+
+def embed_images(images):
+    """Normalized CLIP image embeddings (float32 ndarray, one row per input) for paths, PIL images or BGR ndarrays."""
+    return clip_classifier.encode_images(preprocess_images(images)).float().cpu().numpy()
+
+def predict_batch(images, batch_size=CLIP_BATCH_SIZE, show_progress=False, image_names=None, with_embeddings=False):
+    """
+    Predict crime types for a list of images using CLIP, `batch_size` images per forward.
+    Each image may be a file path, a PIL image or a decoded OpenCV (BGR) ndarray.
+    Returns one dict per input, in input order, shaped like predict_single_image's output
+    (plus an "embedding" ndarray per successful image with `with_embeddings`; see classify_pixel_values).
+    """
+    names = [_image_name(image, i, image_names) for i, image in enumerate(images)]
+
     if not clip_classifier:
         print("❌ CLIP classifier not loaded. Cannot predict.")
-        return {
-            "image_name": os.path.basename(image_path),
+        return [{
+            "image_name": name,
             "error": "CLIP classifier not loaded.",
             "model_type": "unavailable"
-        }
-    try:
-        image_pil = Image.open(image_path).convert("RGB")
-
-        if clip_classifier.use_finetuned:
-            predicted_crime, crime_conf = predict_with_few_shot_finetuned(image_pil)
-            model_type = "clip-few-shot-finetuned"
-        else:
-            predicted_crime, crime_conf = predict_with_zeroshot_clip(image_pil)
-            model_type = "clip-zero-shot"
+        } for name in names]
 
-        # ViT prediction for evidence removed
+    batch_size = max(1, int(batch_size))
+    batch_starts = range(0, len(images), batch_size)
+    if show_progress:
+        batch_starts = tqdm(batch_starts, desc="CLIP Processing batches")
 
-        return {
-            "image_name": os.path.basename(image_path),
-            "predicted_class": predicted_crime,
-            "crime_confidence": crime_conf,
-            # "extracted_evidence": [], # Removed
-            "model_type": model_type,
-            "analysis_mode": "single_image_clip_only"
-        }
+    results = []
+    for start in batch_starts:
+        end = start + batch_size
+        results.extend(_predict_micro_batch(images[start:end], names[start:end], with_embeddings))
+    return results
 
-    except FileNotFoundError:
-        print(f"❌ [ERROR] Image file not found: {image_path}")
-        return {"image_name": os.path.basename(image_path), "error": f"File not found: {image_path}"}
-    except Exception as e:
-        print(f"❌ [ERROR] Failed on {image_path}: {e}")
-        return {"image_name": os.path.basename(image_path), "error": str(e)}
+def predict_single_image(image, image_name=None):
+    """Predict crime type from a single image (path, PIL image or BGR ndarray) using CLIP."""
+    image_names = [image_name] if image_name is not None else None
+    return predict_batch([image], batch_size=1, image_names=image_names)[0]
 
 
-def predict_multiple_images(image_paths_or_video_path):
+def predict_multiple_images(image_paths_or_video_path, batch_size=CLIP_BATCH_SIZE, image_names=None):
     """
     Process multiple images or frames from a video for crime classification using CLIP.
     If a video path is provided, frames will be extracted first.
+    A list may mix image paths, PIL images and decoded BGR ndarrays.
     """
     if not clip_classifier:
         print("❌ CLIP classifier not loaded. Cannot predict multiple images.")
@@ -311,22 +928,26 @@ def predict_multiple_images(image_paths_or_video_path):
     elif isinstance(image_paths_or_video_path, list):
         image_paths_to_process = image_paths_or_video_path
     else:
-        print(f"⚠️ Invalid input to predict_multiple_images: {type(image_paths_or_video_path)}. Expected video path string or list of image paths.")
-        return {"error": "Invalid input type. Expected video path or list of image paths."}
+        print(f"⚠️ Invalid input to predict_multiple_images: {type(image_paths_or_video_path)}. Expected video path string or list of images.")
+        return {"error": "Invalid input type. Expected video path or list of images."}
 
     if not image_paths_to_process:
         return {"error": "No valid frames or images found for CLIP analysis."}
 
     print(f"🎯 Analyzing {len(image_paths_to_process)} images with CLIP model...")
 
+    batch_results = predict_batch(image_paths_to_process, batch_size=batch_size, show_progress=True, image_names=image_names)
+    return aggregate_predictions(batch_results, total_inputs=len(image_paths_to_process))
+
+def aggregate_predictions(batch_results, total_inputs=None):
+    """Confidence-weighted vote over per-image CLIP predictions, as returned by predict_batch."""
     individual_results = []
     crime_votes = {} # Stores sum of confidences for each crime type
     model_type_reported = None # To report which CLIP model type was used
 
-    for img_path in tqdm(image_paths_to_process, desc="CLIP Processing images"):
-        result = predict_single_image(img_path) # This now only returns CLIP results
+    for result in batch_results:
         if not result or "error" in result:
-            print(f"⚠️ Skipping {img_path} due to error: {result.get('error', 'Unknown error') if result else 'None'}")
+            print(f"⚠️ Skipping {result.get('image_name') if result else 'image'} due to error: {result.get('error', 'Unknown error') if result else 'None'}")
             continue
             
         individual_results.append(result)
@@ -366,15 +987,15 @@ def predict_multiple_images(image_paths_or_video_path):
         "crime_class_distribution": crime_distribution,
         # "extracted_evidence_aggregated": [], # Removed
         "images_analyzed_by_clip": len(individual_results),
-        "total_input_image_paths": len(image_paths_to_process),
+        "total_input_image_paths": total_inputs if total_inputs is not None else len(batch_results),
         "clip_model_type_used": model_type_reported,
         "analysis_mode": "multiple_images_clip_only_aggregated"
     }
 
-def process_crime_scene(image_paths):
+def process_crime_scene(image_paths, batch_size=CLIP_BATCH_SIZE):
     """Process multiple images from a crime scene using only CLIP for classification."""
     try:
-        results = predict_multiple_images(image_paths) # Now only uses CLIP
+        results = predict_multiple_images(image_paths, batch_size=batch_size) # Now only uses CLIP
         
         if "error" in results:
             return {
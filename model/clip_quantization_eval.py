@@ -0,0 +1,125 @@
+import argparse
+import copy
+import json
+import os
+import random
+import time
+
+import torch
+
+import clip_pipeline
+from clip_pipeline import FewShotFineTunedCLIP, crime_classes
+
+
+def load_labeled_images(image_folder, max_per_class=50):
+    """(path, class index) pairs from an image_folder/<ClassName>/ layout, as used for training."""
+    samples = []
+    for class_idx, class_name in enumerate(crime_classes):
+        class_dir = os.path.join(image_folder, class_name)
+        if not os.path.isdir(class_dir):
+            print(f"⚠️ Class directory not found: {class_name}")
+            continue
+        images = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')))
+        if max_per_class > 0 and len(images) > max_per_class:
+            images = random.sample(images, max_per_class)
+        samples.extend((os.path.join(class_dir, f), class_idx) for f in images)
+    return samples
+
+
+def class_probs(classifier, pixel_values):
+    """Softmax over crime classes, using the same head/zero-shot choice as the serving path."""
+    with torch.no_grad():
+        if classifier.use_finetuned:
+            logits = classifier.head_logits(pixel_values)
+        else:
+            logits = classifier.logit_scale * classifier.encode_images(pixel_values) @ classifier.text_embeds.t()
+        return torch.softmax(logits, dim=1)
+
+
+def evaluate(fp32, int8, samples, batch_size=16):
+    """Run both models over the samples and compare their verdicts and confidences."""
+    fp32_probs, int8_probs, labels = [], [], []
+    fp32_time = int8_time = 0.0
+
+    clip_pipeline.clip_classifier = fp32 # preprocess_images uses the global classifier's processor
+    for start in range(0, len(samples), batch_size):
+        batch = samples[start:start + batch_size]
+        pixel_values = clip_pipeline.preprocess_images([path for path, _ in batch])
+
+        started = time.perf_counter()
+        fp32_probs.append(class_probs(fp32, pixel_values))
+        fp32_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        int8_probs.append(class_probs(int8, pixel_values))
+        int8_time += time.perf_counter() - started
+
+        labels.extend(label for _, label in batch)
+
+    fp32_probs = torch.cat(fp32_probs)
+    int8_probs = torch.cat(int8_probs)
+    labels = torch.tensor(labels)
+    fp32_conf, fp32_pred = fp32_probs.max(dim=1)
+    int8_pred = int8_probs.argmax(dim=1)
+    # Drift in the probability int8 assigns to fp32's chosen class
+    confidence_drift = (int8_probs.gather(1, fp32_pred.unsqueeze(1)).squeeze(1) - fp32_conf).abs()
+
+    disagreements = {}
+    for pred_a, pred_b in zip(fp32_pred[fp32_pred != int8_pred].tolist(), int8_pred[fp32_pred != int8_pred].tolist()):
+        key = f"{crime_classes[pred_a]} -> {crime_classes[pred_b]}"
+        disagreements[key] = disagreements.get(key, 0) + 1
+
+    n = len(labels)
+    return {
+        "images": n,
+        "top1_agreement": round((fp32_pred == int8_pred).float().mean().item(), 4),
+        "confidence_drift_mean": round(confidence_drift.mean().item(), 4),
+        "confidence_drift_max": round(confidence_drift.max().item(), 4),
+        "prob_l1_mean": round((fp32_probs - int8_probs).abs().sum(dim=1).mean().item(), 4),
+        "fp32_accuracy": round((fp32_pred == labels).float().mean().item(), 4),
+        "int8_accuracy": round((int8_pred == labels).float().mean().item(), 4),
+        "fp32_ms_per_image": round(1000 * fp32_time / n, 2),
+        "int8_ms_per_image": round(1000 * int8_time / n, 2),
+        "speedup": round(fp32_time / int8_time, 2) if int8_time > 0 else None,
+        "disagreements": dict(sorted(disagreements.items(), key=lambda item: -item[1])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare INT8 dynamic-quantized CLIP against fp32 on a labeled image folder.")
+    parser.add_argument("--images", required=True, help="Folder with one subfolder per crime class")
+    parser.add_argument("--checkpoint", default="clip.pth")
+    parser.add_argument("--max-per-class", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--min-agreement", type=float, default=0.98, help="Exit non-zero if top-1 agreement is lower")
+    parser.add_argument("--output", default=None, help="Optional path for the JSON report")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    samples = load_labeled_images(args.images, args.max_per_class)
+    if not samples:
+        raise SystemExit("No labeled images found.")
+    print(f"🎯 Evaluating {len(samples)} images")
+
+    fp32 = FewShotFineTunedCLIP(model_path=args.checkpoint)
+    int8 = copy.deepcopy(fp32)
+    int8.quantize_int8()
+    if not int8.quantized:
+        raise SystemExit("INT8 quantization is unavailable on this device.")
+
+    report = evaluate(fp32, int8, samples, args.batch_size)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report saved to {args.output}")
+
+    if report["top1_agreement"] < args.min_agreement:
+        print(f"❌ Top-1 agreement {report['top1_agreement']:.4f} is below {args.min_agreement:.4f}; keep CLIP_QUANTIZE off.")
+        raise SystemExit(1)
+    print(f"✅ Top-1 agreement {report['top1_agreement']:.4f} meets the {args.min_agreement:.4f} guard.")
+
+
+if __name__ == "__main__":
+    main()
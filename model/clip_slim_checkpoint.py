@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import time
+
+import torch
+from safetensors.torch import save_file
+
+from clip_pipeline import CLIP_SLIM_FORMAT, FewShotFineTunedCLIP
+
+
+def slim_tensors(clip):
+    """Vision tower, visual projection, classifier head and prompt embeddings; the text tower is left out."""
+    tensors = {}
+    for prefix, module in (
+        ("model.vision_model.", clip.model.vision_model),
+        ("model.visual_projection.", clip.model.visual_projection),
+        ("classifier.", clip.classifier),
+    ):
+        tensors.update({prefix + name: tensor for name, tensor in module.state_dict().items()})
+    tensors["text_embeds"] = clip.text_embeds
+    return {name: tensor.detach().cpu().contiguous() for name, tensor in tensors.items()}
+
+
+def slim_metadata(clip, model_name, source_checkpoint):
+    """safetensors metadata is str -> str, so structured values are stored as JSON."""
+    return {
+        "format": CLIP_SLIM_FORMAT,
+        "model_name": model_name,
+        "source_checkpoint": os.path.basename(source_checkpoint),
+        "use_finetuned": "true" if clip.use_finetuned else "false",
+        "logit_scale": repr(clip.logit_scale),
+        "crime_classes": json.dumps(clip.class_names),
+        "prompts": json.dumps(clip.prompts),
+        "vision_config": clip.model.config.vision_config.to_json_string(use_diff=False),
+        "image_processor": clip.processor.image_processor.to_json_string(),
+    }
+
+
+def convert(checkpoint, output, model_name):
+    clip = FewShotFineTunedCLIP(model_path=checkpoint, model_name=model_name, backend="torch")
+    vision_config = clip.model.config.vision_config
+    vision_config.projection_dim = clip.model.config.projection_dim # CLIPVisionModelWithProjection reads it from here
+    save_file(slim_tensors(clip), output, metadata=slim_metadata(clip, model_name, checkpoint))
+    print(f"💾 Slim CLIP checkpoint saved to {output} ({os.path.getsize(output) / 1024 / 1024:.1f} MB)")
+    if os.path.exists(checkpoint):
+        print(f"   Source checkpoint: {checkpoint} ({os.path.getsize(checkpoint) / 1024 / 1024:.1f} MB)")
+    return clip
+
+
+def verify(full, output, batch_size=4):
+    """Load the slim file the way the server does and compare its outputs with the full model."""
+    started = time.perf_counter()
+    slim = FewShotFineTunedCLIP(model_path=output)
+    print(f"⏱ Slim load took {time.perf_counter() - started:.2f}s")
+
+    image_size = full.model.config.vision_config.image_size
+    pixel_values = torch.randn(batch_size, 3, image_size, image_size, device=full.device)
+    embeds_diff = (full.encode_images(pixel_values) - slim.encode_images(pixel_values)).abs().max().item()
+    logits_diff = (full.head_logits(pixel_values) - slim.head_logits(pixel_values)).abs().max().item()
+    text_diff = (full.text_embeds - slim.text_embeds).abs().max().item()
+    print(f"🔬 Max abs diff: image_embeds={embeds_diff:.6f}, head_logits={logits_diff:.6f}, text_embeds={text_diff:.6f}")
+    return max(embeds_diff, logits_diff, text_diff)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a CLIP checkpoint into a slim, memory-mappable inference checkpoint.")
+    parser.add_argument("--checkpoint", default="clip.pth", help="Fine-tuned CLIP checkpoint (zero-shot CLIP if missing)")
+    parser.add_argument("--output", default="clip_slim.safetensors")
+    parser.add_argument("--model-name", default="openai/clip-vit-base-patch32")
+    parser.add_argument("--skip-verify", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="Max allowed abs diff in the verification step")
+    args = parser.parse_args()
+
+    if not args.output.endswith(".safetensors"):
+        raise SystemExit("The output file must end in .safetensors so the server recognizes it.")
+
+    full = convert(args.checkpoint, args.output, args.model_name)
+    if args.skip_verify:
+        return
+    max_diff = verify(full, args.output)
+    if max_diff > args.tolerance:
+        print(f"❌ Slim checkpoint differs from the full model by {max_diff:.6f} (> {args.tolerance}).")
+        raise SystemExit(1)
+    print("✅ Slim checkpoint matches the full model.")
+    print(f"   Serve it with CLIP_MODEL_PATH={args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+
+class DynamicBatcher:
+    """
+    Collects items submitted by concurrent requests into batches and runs them together.
+    A batch is dispatched once it holds `max_batch_size` items or `max_wait_ms` has passed
+    since its first item arrived, whichever comes first. `process_batch(items)` is a blocking
+    function returning one result per item; it runs via `run_batch` (e.g. the inference executor)
+    so the event loop is never blocked.
+    """
+
+    def __init__(self, process_batch, run_batch, max_batch_size=8, max_wait_ms=10):
+        self.process_batch = process_batch
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self._queue = None
+        self._collector = None
+        self._inflight = set() # Strong refs so dispatched batch tasks aren't garbage-collected mid-run
+        self._batches_run = 0
+        self._items_run = 0
+
+    def _ensure_collector(self):
+        # Created lazily so the queue and task belong to the running event loop
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue()
+            self._collector = asyncio.create_task(self._collect())
+
+    async def submit(self, item):
+        """Queue one item and wait for its result from whichever batch it lands in."""
+        self._ensure_collector()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch without waiting, so the next batch can fill while this one runs
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = await self.run_batch(self.process_batch, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self._batches_run += 1
+        self._items_run += len(items)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "pending": self._queue.qsize() if self._queue else 0,
+            "batches_run": self._batches_run,
+            "avg_batch_size": round(self._items_run / self._batches_run, 2) if self._batches_run else 0.0,
+        }
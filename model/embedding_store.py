@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(ids, scores, k):
+    """The k highest-scoring (id, score) pairs, best first."""
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        ids, scores = ids[keep], scores[keep]
+    order = np.argsort(-scores, kind="stable")
+    return ids[order], scores[order]
+
+
+class IVFIndex:
+    """
+    Inverted-file index over normalized vectors: spherical k-means centroids, and for each centroid
+    the row ids assigned to it. A search only scores the rows of the `nprobe` centroids nearest the query.
+    """
+
+    def __init__(self, vectors, nlist, iterations=10, train_size=None, seed=0, chunk_size=65536):
+        rng = np.random.default_rng(seed)
+        self.size = len(vectors)
+        self.nlist = max(1, min(int(nlist), self.size))
+        train_size = min(self.size, train_size or max(40 * self.nlist, 10000))
+        sample = np.asarray(vectors[np.sort(rng.choice(self.size, train_size, replace=False))], dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=self.nlist)
+            filled = counts > 0 # Empty clusters keep their previous centroid
+            centroids[filled] = _normalize(sums[filled])
+        self.centroids = centroids
+
+        assignments = np.empty(self.size, dtype=np.int32)
+        for start in range(0, self.size, chunk_size):
+            chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+            assignments[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+        self._order = np.argsort(assignments, kind="stable")
+        self._offsets = np.searchsorted(assignments[self._order], np.arange(self.nlist + 1))
+
+    def candidates(self, query, nprobe):
+        """Row ids in the `nprobe` lists whose centroids are closest to `query`."""
+        probes = np.argsort(-(self.centroids @ query))[:max(1, nprobe)]
+        return np.concatenate([self._order[self._offsets[c]:self._offsets[c + 1]] for c in probes])
+
+
+class EmbeddingStore:
+    """
+    Persistent, append-only store of normalized CLIP image embeddings with one metadata record per row.
+    Vectors are a raw float32 file that is memory-mapped for search; metadata is a JSON-lines file.
+    Both are only appended to, vectors first, so a crash can at worst leave a partial last row,
+    which is trimmed when the store is opened. Searches are exact up to `exact_search_max` rows;
+    beyond that an IVF index is built over the store and rebuilt once enough new rows have arrived.
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    METADATA_FILE = "metadata.jsonl"
+    INFO_FILE = "store.json"
+
+    def __init__(self, directory, exact_search_max=50000, nprobe=8, rebuild_fraction=0.25):
+        self.directory = directory
+        self.exact_search_max = exact_search_max
+        self.nprobe = nprobe
+        self.rebuild_fraction = rebuild_fraction
+        self._vectors_path = os.path.join(directory, self.VECTORS_FILE)
+        self._metadata_path = os.path.join(directory, self.METADATA_FILE)
+        self._info_path = os.path.join(directory, self.INFO_FILE)
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._matrix = None
+        self._index = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.dim = None
+        if os.path.exists(self._info_path):
+            with open(self._info_path) as f:
+                self.dim = json.load(f)["dim"]
+        self._metadata = self._recover()
+        self._analysis_rows = Counter(record.get("analysis_id") for record in self._metadata)
+
+    def _recover(self):
+        """Load metadata and trim both files to the last row that was fully written to each."""
+        records, line_ends = [], [0]
+        if os.path.exists(self._metadata_path):
+            with open(self._metadata_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+                    line_ends.append(line_ends[-1] + len(line))
+        rows = os.path.getsize(self._vectors_path) // (4 * self.dim) if self.dim and os.path.exists(self._vectors_path) else 0
+        count = min(len(records), rows)
+        records = records[:count]
+        good_bytes = line_ends[count]
+        if os.path.exists(self._metadata_path) and os.path.getsize(self._metadata_path) != good_bytes:
+            print(f"⚠️ Trimming embedding metadata to {count} complete rows.")
+            os.truncate(self._metadata_path, good_bytes)
+        if self.dim and os.path.exists(self._vectors_path) and os.path.getsize(self._vectors_path) != count * 4 * self.dim:
+            print(f"⚠️ Trimming embedding vectors to {count} complete rows.")
+            os.truncate(self._vectors_path, count * 4 * self.dim)
+        return records
+
+    def __len__(self):
+        return len(self._metadata)
+
+    def has_analysis(self, analysis_id):
+        return self._analysis_rows[analysis_id] > 0
+
+    def append(self, embeddings, records):
+        """Append one embedding per metadata record. Each record gets `id` (its row) and `created_at`."""
+        vectors = _normalize(np.atleast_2d(embeddings))
+        if len(vectors) != len(records):
+            raise ValueError("Need exactly one metadata record per embedding.")
+        if not len(vectors):
+            return []
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self._info_path, "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store's {self.dim}.")
+            first_id = len(self._metadata)
+            now = time.time()
+            records = [{"id": first_id + i, "created_at": now, **record} for i, record in enumerate(records)]
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._metadata_path, "a") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+            self._metadata.extend(records)
+            self._analysis_rows.update(record.get("analysis_id") for record in records)
+            self._matrix = None
+        return [record["id"] for record in records]
+
+    def _vectors(self):
+        """Memory-mapped (rows, dim) view of the store, refreshed after appends."""
+        with self._lock:
+            count = len(self._metadata)
+            if count == 0:
+                return None
+            if self._matrix is None or len(self._matrix) != count:
+                self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+            return self._matrix
+
+    def vector(self, row_id):
+        vectors = self._vectors()
+        if vectors is None or not 0 <= row_id < len(vectors):
+            raise KeyError(row_id)
+        return np.array(vectors[row_id])
+
+    def record(self, row_id):
+        with self._lock:
+            if not 0 <= row_id < len(self._metadata):
+                raise KeyError(row_id)
+            return dict(self._metadata[row_id])
+
+    def _ivf_index(self, vectors):
+        """The current IVF index, (re)built when missing or when too many rows were appended since."""
+        with self._index_lock:
+            index = self._index
+            if index is None or len(vectors) - index.size > self.rebuild_fraction * index.size:
+                started = time.perf_counter()
+                index = IVFIndex(vectors, nlist=int(np.clip(np.sqrt(len(vectors)), 16, 4096)))
+                self._index = index
+                print(f"🗂 Built IVF index over {index.size} embeddings ({index.nlist} lists) in {time.perf_counter() - started:.2f}s")
+            return index
+
+    def search(self, query, k=10, exclude_analysis_id=None, chunk_size=65536):
+        """
+        Top-k rows by cosine similarity to `query`. Returns metadata records with a `score`, best first.
+        `exclude_analysis_id` drops rows from that analysis (e.g. the other frames of the query's own video).
+        """
+        vectors = self._vectors()
+        if vectors is None or k <= 0:
+            return []
+        query = _normalize(query).reshape(-1)
+        wanted = int(k)
+        if exclude_analysis_id is not None:
+            k = wanted + self._analysis_rows[exclude_analysis_id] # Enough to survive the filter
+        k = min(int(k), len(vectors))
+
+        if len(vectors) <= self.exact_search_max:
+            best_ids, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            for start in range(0, len(vectors), chunk_size):
+                scores = np.asarray(vectors[start:start + chunk_size]) @ query
+                ids = np.arange(start, start + len(scores))
+                best_ids, best_scores = _top_k(np.concatenate([best_ids, ids]), np.concatenate([best_scores, scores]), k)
+        else:
+            index = self._ivf_index(vectors)
+            # Rows appended after the index was built are scored exactly
+            candidates = np.concatenate([index.candidates(query, self.nprobe), np.arange(index.size, len(vectors))])
+            candidates.sort() # Sequential reads from the memory map
+            best_ids, best_scores = _top_k(candidates, vectors[candidates] @ query, k)
+
+        with self._lock:
+            results = [{**self._metadata[row_id], "score": round(float(score), 4)} for row_id, score in zip(best_ids.tolist(), best_scores)]
+        if exclude_analysis_id is not None:
+            results = [result for result in results if result.get("analysis_id") != exclude_analysis_id]
+        return results[:wanted]
+
+    def stats(self):
+        index = self._index
+        return {
+            "directory": self.directory,
+            "embeddings": len(self._metadata),
+            "dim": self.dim,
+            "analyses": len(self._analysis_rows),
+            "search_mode": "exact" if len(self._metadata) <= self.exact_search_max else "ivf",
+            "ivf_index_size": index.size if index else None,
+            "ivf_lists": index.nlist if index else None,
+        }
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the executor already holds as many jobs as it is allowed to queue."""
+
+
+class InferenceExecutor:
+    """
+    Runs blocking YOLO/CLIP work on a small thread pool so the FastAPI event loop stays free.
+    At most `max_workers` jobs run at once and at most `max_queue` more wait behind them;
+    anything beyond that is rejected immediately with InferenceQueueFull.
+    `on_queue_wait(seconds)`, if given, is called with each job's time in the queue (e.g. a histogram).
+    """
+
+    def __init__(self, max_workers=1, max_queue=8, on_queue_wait=None):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_queue_wait = 0.0
+        self._on_queue_wait = on_queue_wait
+
+    def _run_job(self, submitted_at, fn, args, kwargs):
+        queue_wait = time.perf_counter() - submitted_at
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._total_queue_wait += queue_wait
+        try:
+            if self._on_queue_wait:
+                self._on_queue_wait(queue_wait)
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    def _on_done(self, future):
+        # A job cancelled before it started never reaches _run_job, so give its queue slot back here
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)` and return a concurrent.futures.Future, or raise InferenceQueueFull."""
+        with self._lock:
+            if self._queued + self._running >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise InferenceQueueFull(
+                    f"Inference queue is full ({self._running} running, {self._queued} queued)."
+                )
+            self._queued += 1
+        future = self._pool.submit(self._run_job, time.perf_counter(), fn, args, kwargs)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def has_capacity(self):
+        """True if a submit() right now would be accepted."""
+        with self._lock:
+            return self._queued + self._running < self.max_workers + self.max_queue
+
+    async def run(self, fn, *args, **kwargs):
+        """Await `fn(*args, **kwargs)` on the inference pool without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self):
+        """Snapshot of queue depth and throughput counters, for sizing the pool under load."""
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._queued,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_queue_wait_ms": round(1000 * self._total_queue_wait / started, 2) if started else 0.0,
+            }
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,271 @@
+import asyncio
+import threading
+import time
+
+import cv2
+
+
+class LatestFrameCapture:
+    """
+    Reads a cv2.VideoCapture source on its own thread and keeps only the newest frame.
+    Consumers never see a backlog: if they are slower than the camera, old frames are simply overwritten.
+    `source` is anything cv2.VideoCapture accepts: a device index, a video file or an RTSP/HTTP URL.
+    For files, `loop=True` rewinds at the end and `realtime=True` paces reads to the file's own FPS,
+    so a local clip can stand in for a live camera.
+    """
+
+    def __init__(self, source=0, loop=False, realtime=False):
+        self.source = source
+        self.loop = loop
+        self.realtime = realtime
+        self.failed = False
+        self._cap = None
+        self._thread = None
+        self._running = False
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+
+    def start(self):
+        """Open the source and start reading. Returns False if it could not be opened."""
+        self._cap = cv2.VideoCapture(self.source)
+        if not self._cap.isOpened():
+            self._cap.release()
+            return False
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name=f"capture-{self.source}", daemon=True)
+        self._thread.start()
+        return True
+
+    def _loop(self):
+        native_fps = self._cap.get(cv2.CAP_PROP_FPS) if self.realtime else 0
+        frame_period = 1.0 / native_fps if native_fps and native_fps > 0 else 0.0
+        next_read = time.monotonic()
+        while self._running:
+            if frame_period:
+                delay = next_read - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_read = max(next_read + frame_period, time.monotonic() - frame_period)
+            ret, frame = self._cap.read()
+            if not ret and self.loop:
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, frame = self._cap.read()
+            if not ret:
+                self.failed = True
+                break
+            with self._cond:
+                self._frame = frame
+                self._seq += 1
+                self._cond.notify_all()
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait_for_frame(self, after_seq=0, timeout=1.0):
+        """Block until a frame newer than `after_seq` exists. Returns (seq, frame), or (after_seq, None) on timeout/stop."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or not self._running, timeout=timeout)
+            if self._seq > after_seq:
+                return self._seq, self._frame
+            return after_seq, None
+
+    def latest(self):
+        """Non-blocking peek at the newest frame: (seq, frame), with seq 0 before the first frame."""
+        with self._cond:
+            return self._seq, self._frame
+
+    @property
+    def running(self):
+        return self._running
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        if self._cap is not None and self._cap.isOpened():
+            self._cap.release()
+
+
+class DetectionWorker:
+    """
+    Runs `detect_fn(frame)` on the newest captured frame, as fast as it can sustain, on its own thread.
+    Frames that arrive while a detection is running are skipped, so the stream is never held back by
+    inference; readers draw the most recent detections onto whatever frame they are showing.
+    """
+
+    def __init__(self, capture, detect_fn):
+        self.capture = capture
+        self.detect_fn = detect_fn
+        self.inference_fps = 0.0
+        self.frames_inferred = 0
+        self.frames_failed = 0
+        self._detections = []
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="detection-worker", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        last_seq = 0
+        while self._running and self.capture.running:
+            last_seq, frame = self.capture.wait_for_frame(last_seq, timeout=0.5)
+            if frame is None:
+                continue
+            started = time.perf_counter()
+            try:
+                detections = self.detect_fn(frame)
+            except Exception:
+                # e.g. the shared inference queue is full: skip this frame and try the next one
+                self.frames_failed += 1
+                time.sleep(0.01)
+                continue
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._detections = detections
+            self.frames_inferred += 1
+            # Exponential moving average keeps the reported FPS stable
+            current_fps = 1.0 / elapsed if elapsed > 0 else 0.0
+            self.inference_fps = current_fps if self.frames_inferred == 1 else 0.9 * self.inference_fps + 0.1 * current_fps
+
+    def latest_detections(self):
+        with self._lock:
+            return self._detections
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+
+class StreamHub:
+    """
+    One capture, one detection worker and one render/encode per frame, fanned out to any number
+    of viewers. Each subscriber has its own small queue; when a viewer falls behind, its oldest
+    pending chunk is dropped, so a slow viewer never slows the source or the other viewers.
+    `render_fn(frame, detections)` returns the bytes to send for a frame and runs off the event loop.
+    With `idle_timeout_s`, the hub stops itself (releasing the source and the detection loop) once it
+    has had no viewers for that long; None keeps it running until stop() is called.
+    """
+
+    def __init__(self, source, detect_fn, render_fn, subscriber_queue_size=2, idle_timeout_s=None):
+        self.source = source
+        self.detect_fn = detect_fn
+        self.render_fn = render_fn
+        self.subscriber_queue_size = max(1, int(subscriber_queue_size))
+        self.idle_timeout_s = idle_timeout_s
+        self.frames_broadcast = 0
+        self.chunks_dropped = 0
+        self._subscribers = set()
+        self._capture = None
+        self._detector = None
+        self._task = None
+        self._idle_task = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Open the source and start broadcasting. Returns False if the source could not be opened."""
+        async with self._lock:
+            if self.running:
+                return True
+            capture = LatestFrameCapture(self.source)
+            if not await asyncio.to_thread(capture.start):
+                return False
+            self._capture = capture
+            self._detector = DetectionWorker(capture, self.detect_fn) if self.detect_fn else None
+            if self._detector:
+                self._detector.start()
+            self._task = asyncio.create_task(self._broadcast_loop())
+            return True
+
+    def subscribe(self):
+        """Register a viewer. Returns its queue; a None chunk means the stream has ended."""
+        queue = asyncio.Queue(maxsize=self.subscriber_queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+        if not self._subscribers and self.idle_timeout_s is not None and self.running:
+            if self._idle_task is None or self._idle_task.done():
+                self._idle_task = asyncio.get_running_loop().create_task(self._stop_when_idle())
+
+    async def _stop_when_idle(self):
+        """Stop after idle_timeout_s without viewers, unless one has (re)joined by then, e.g. a page reload."""
+        await asyncio.sleep(self.idle_timeout_s)
+        async with self._lock:
+            if self._subscribers or self._task is None:
+                return
+            print(f"No viewers for {self.idle_timeout_s}s, releasing the stream source.")
+            await self._stop_locked()
+
+    def _publish(self, chunk):
+        for queue in list(self._subscribers):
+            if queue.full():
+                try:
+                    queue.get_nowait() # Drop this viewer's oldest chunk rather than wait for it
+                    self.chunks_dropped += 1
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(chunk)
+
+    async def _broadcast_loop(self):
+        last_seq = 0
+        try:
+            while True:
+                seq, frame = await asyncio.to_thread(self._capture.wait_for_frame, last_seq, 1.0)
+                if frame is None:
+                    if not self._capture.running:
+                        print("Error: Failed to grab frame from stream source. Stopping.")
+                        break
+                    continue
+                last_seq = seq
+                if not self._subscribers:
+                    continue # Nobody watching: skip the render/encode work
+                detections = self._detector.latest_detections() if self._detector else []
+                chunk = await asyncio.to_thread(self.render_fn, frame, detections)
+                if chunk is None:
+                    continue
+                self._publish(chunk)
+                self.frames_broadcast += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"An unexpected error occurred during stream broadcast: {e}")
+        finally:
+            if self._detector:
+                await asyncio.to_thread(self._detector.stop)
+            await asyncio.to_thread(self._capture.stop)
+            self._publish(None) # Tell every viewer the stream is over
+            print("Stream resources released and broadcast stopped.")
+
+    async def stop(self):
+        async with self._lock:
+            await self._stop_locked()
+
+    async def _stop_locked(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "subscribers": len(self._subscribers),
+            "frames_broadcast": self.frames_broadcast,
+            "chunks_dropped": self.chunks_dropped,
+            "inference_fps": round(self._detector.inference_fps, 2) if self._detector else 0.0,
+        }
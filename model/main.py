@@ -1,71 +1,228 @@
 import os
+import hashlib
+import json
 import cv2
 import numpy as np
 import asyncio
 import shutil
-from typing import List, Optional
+import tempfile
+import threading
+import time
+from functools import partial
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 from PIL import Image as PILImage # Alias to avoid conflict with FastAPI's Image
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from ultralytics import YOLO
 from fastapi.staticfiles import StaticFiles # Import StaticFiles for serving HTML
+from pydantic import BaseModel
 
 # Assuming clip_pipeline.py is in the same directory
 import clip_pipeline # type: ignore
+import metrics # type: ignore
+from inference_executor import InferenceExecutor, InferenceQueueFull # type: ignore
+from dynamic_batcher import DynamicBatcher # type: ignore
+from staged_pipeline import Stage, StagedPipeline # type: ignore
+from analysis_cache import AnalysisCache, content_hash, make_key # type: ignore
+from live_stream import StreamHub # type: ignore
+from stream_scheduler import StreamScheduler # type: ignore
+from model_registry import ModelRegistry # type: ignore
+from embedding_store import EmbeddingStore # type: ignore
+from request_profiler import TRACE_KINDS, RequestProfile, profile_stage # type: ignore
+from upload_pipe import UploadPipe, UploadStalled, VideoLimitExceeded # type: ignore
 
 # --- Configuration ---
 YOLO_MODEL_PATH = "best.pt"  # Your YOLOv8 model
-CLIP_MODEL_PATH = "clip.pth" # Your fine-tuned CLIP model
-FRAME_FOLDER = "frames" # Folder to store extracted frames for video processing & temp webcam frames
+CLIP_MODEL_PATH = os.getenv("CLIP_MODEL_PATH", "clip.pth") # Your fine-tuned CLIP model, or a slim .safetensors from clip_slim_checkpoint.py
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "torch") # "torch", or "torchscript"/"onnxruntime" after running clip_export.py; onnxruntime needs `uv sync --extra onnx`
+CLIP_EXPORT_DIR = os.getenv("CLIP_EXPORT_DIR", clip_pipeline.CLIP_EXPORT_DIR) # Output folder of clip_export.py
+CLIP_QUANTIZE = os.getenv("CLIP_QUANTIZE", "0") == "1" # Dynamic INT8 CLIP on CPU (torch backend); validate with clip_quantization_eval.py
+CLIP_INFERENCE_ONLY = os.getenv("CLIP_INFERENCE_ONLY", "1") == "1" # Free the CLIP text tower once the prompts are embedded
+FRAME_FOLDER = "frames" # Folder to store extracted frames for video processing
+SAVE_VIDEO_FRAMES = os.getenv("SAVE_VIDEO_FRAMES", "0") == "1" # Also write sampled video frames to FRAME_FOLDER as JPEGs
+VIDEO_FRAME_SEEK = os.getenv("VIDEO_FRAME_SEEK", "0") == "1" # Seek to sampled frames instead of grab()bing past skipped ones
+STREAM_FORMATS = ("ndjson", "sse") # Wire formats of /process-video-progressive/
+VIDEO_STREAM_MAX_BYTES = int(os.getenv("VIDEO_STREAM_MAX_BYTES", str(4 * 1024 ** 3))) # /process-video-stream/ uploads larger than this get a 413; 0 disables
+VIDEO_STREAM_MAX_DURATION_S = float(os.getenv("VIDEO_STREAM_MAX_DURATION_S", "7200")) # ...and so do videos longer than this; 0 disables
+VIDEO_STREAM_SAMPLE_INTERVAL_S = float(os.getenv("VIDEO_STREAM_SAMPLE_INTERVAL_S", "1.0")) # Seconds between sampled frames, to the end of the video, when the container does not report its duration
+VIDEO_STREAM_BUFFER_MB = int(os.getenv("VIDEO_STREAM_BUFFER_MB", "16")) # Upload data (1 MB chunks) allowed to queue ahead of the decoder
+VIDEO_STREAM_IDLE_TIMEOUT_S = float(os.getenv("VIDEO_STREAM_IDLE_TIMEOUT_S", "30")) # Fail a /process-video-stream/ upload (408) when the client sends nothing for this long; 0 disables
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1")) # Concurrent YOLO/CLIP jobs; YOLO forwards still run one at a time (see yolo_lock)
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "8")) # Jobs allowed to wait before requests get 503
+YOLO_BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "16")) # Frames per YOLO forward on video frames
+VIDEO_PIPELINE_BATCH_SIZE = int(os.getenv("VIDEO_PIPELINE_BATCH_SIZE", "8")) # Frames per item flowing through the video pipeline
+VIDEO_PIPELINE_QUEUE_SIZE = int(os.getenv("VIDEO_PIPELINE_QUEUE_SIZE", "2")) # Items buffered in front of each pipeline stage
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "1")) # Threads for the CLIP preprocessing stage
+CLIP_WORKERS = int(os.getenv("CLIP_WORKERS", "1")) # Threads for the CLIP forward stage
+YOLO_WORKERS = int(os.getenv("YOLO_WORKERS", "1")) # Threads for the YOLO stage; they share yolo_lock, so only box conversion overlaps
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "256")) # Results kept in memory, keyed by upload hash
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR") # Optional on-disk cache tier (directory of JSON files)
+ANALYSIS_CACHE_DISK_MB = int(os.getenv("ANALYSIS_CACHE_DISK_MB", "512")) # Size limit for the on-disk tier
+WEBCAM_SOURCE = int(os.getenv("WEBCAM_SOURCE", "0")) # cv2.VideoCapture device index for the live feed
+WEBCAM_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("WEBCAM_SUBSCRIBER_QUEUE_SIZE", "2")) # Frames buffered per viewer before its oldest is dropped
+WEBCAM_IDLE_TIMEOUT_S = float(os.getenv("WEBCAM_IDLE_TIMEOUT_S", "2")) # Release the camera and stop YOLO this long after the last viewer leaves
+STREAM_BATCH_MAX_SIZE = int(os.getenv("STREAM_BATCH_MAX_SIZE", "8")) # Frames from different registered streams per shared YOLO/CLIP call
+IMAGE_BATCH_MAX_SIZE = int(os.getenv("IMAGE_BATCH_MAX_SIZE", "8")) # Max images per cross-request YOLO/CLIP batch
+IMAGE_BATCH_MAX_WAIT_MS = float(os.getenv("IMAGE_BATCH_MAX_WAIT_MS", "10")) # Max time the first image waits for others to join
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "embedding_store") # CLIP embeddings of analyzed images/frames, for similarity search; empty disables
+EMBEDDING_EXACT_SEARCH_MAX = int(os.getenv("EMBEDDING_EXACT_SEARCH_MAX", "50000")) # Above this many embeddings, search through an IVF index
+EMBEDDING_IVF_PROBES = int(os.getenv("EMBEDDING_IVF_PROBES", "8")) # IVF lists scanned per search (recall vs speed)
+PROFILE_TRACE_DIR = os.getenv("PROFILE_TRACE_DIR", "profiles") # Where profile_trace=cprofile|torch requests write their trace files
+WARMUP_SIZES = [ # WIDTHxHEIGHT frames pushed through each model after loading; empty disables warm-up
+    tuple(int(v) for v in size.lower().split("x")) for size in os.getenv("WARMUP_SIZES", "640x480,1280x720").split(",") if size.strip()
+]
 
 # --- Model Loading ---
+# Models load on a background thread (see model_registry) so uvicorn starts listening immediately;
+# /readyz reports when they are usable and how long loading and warm-up took.
 yolo_model = None
-try:
-    if os.path.exists(YOLO_MODEL_PATH):
-        yolo_model = YOLO(YOLO_MODEL_PATH)
-        print("Successfully loaded YOLOv8 model.")
-    else:
+yolo_lock = threading.Lock() # One ultralytics model is not safe to call from several threads at once
+
+def load_yolo_model():
+    global yolo_model
+    if not os.path.exists(YOLO_MODEL_PATH):
         print(f"Error: YOLOv8 model file not found at {YOLO_MODEL_PATH}")
-except Exception as e:
-    print(f"Error loading YOLOv8 model: {e}")
+        return False
+    yolo_model = YOLO(YOLO_MODEL_PATH)
+    print("Successfully loaded YOLOv8 model.")
+    return True
 
-try:
-    print(f"Loading CLIP model from: {CLIP_MODEL_PATH}")
-    if not os.path.exists(CLIP_MODEL_PATH):
-        print(f"Error: CLIP model file not found at {CLIP_MODEL_PATH}. CLIP features will be unavailable.")
-        clip_pipeline.clip_classifier = None
-    else:
-        clip_pipeline.load_models(clip_checkpoint=CLIP_MODEL_PATH)
-        if clip_pipeline.clip_classifier:
-            print("Successfully loaded CLIP model.")
-        else:
-            print("CLIP model might not have loaded correctly.")
-except ImportError as e:
-    print(f"ImportError during CLIP model loading: {e}.")
-    if hasattr(clip_pipeline, 'clip_classifier'):
+def load_clip_model():
+    clip_source = CLIP_MODEL_PATH if CLIP_BACKEND == "torch" else CLIP_EXPORT_DIR
+    print(f"Loading CLIP model from: {clip_source}")
+    if not os.path.exists(clip_source):
+        print(f"Error: CLIP model file not found at {clip_source}. CLIP features will be unavailable.")
         clip_pipeline.clip_classifier = None
-except Exception as e:
-    print(f"Error loading CLIP model: {e}.")
-    if hasattr(clip_pipeline, 'clip_classifier'):
+        return False
+    try:
+        clip_pipeline.load_models(clip_checkpoint=CLIP_MODEL_PATH, backend=CLIP_BACKEND, export_dir=CLIP_EXPORT_DIR, quantize=CLIP_QUANTIZE, inference_only=CLIP_INFERENCE_ONLY)
+    except Exception:
         clip_pipeline.clip_classifier = None
+        raise
+    if not clip_pipeline.clip_classifier:
+        print("CLIP model might not have loaded correctly.")
+        return False
+    print("Successfully loaded CLIP model.")
+    return True
+
+def _warmup_frames():
+    return [np.zeros((height, width, 3), dtype=np.uint8) for width, height in WARMUP_SIZES]
+
+def warmup_yolo_model():
+    """One forward per warm-up size, plus one batched forward, so the first request skips lazy init."""
+    frames = _warmup_frames()
+    for frame in frames:
+        yolo_detect_objects(frame)
+    if len(frames) > 1:
+        yolo_detect_batch(frames)
 
+def warmup_clip_model():
+    frames = _warmup_frames()
+    for frame in frames:
+        clip_pipeline.predict_batch([frame])
+    if len(frames) > 1:
+        clip_pipeline.predict_batch(frames)
 
-app = FastAPI(title="Crime Detection API with YOLO, (CLIP removed from Webcam), and Webcam Streaming")
+model_registry = ModelRegistry()
+model_registry.register("yolo", load_yolo_model, warmup_yolo_model if WARMUP_SIZES else None)
+model_registry.register("clip", load_clip_model, warmup_clip_model if WARMUP_SIZES else None)
+
+def require_models():
+    """503 while models are still loading (with Retry-After), or if neither model could be loaded."""
+    if not model_registry.loading_finished:
+        raise HTTPException(status_code=503, detail="Models are still loading.", headers={"Retry-After": "5"})
+    if not yolo_model and not (hasattr(clip_pipeline, 'clip_classifier') and clip_pipeline.clip_classifier):
+        raise HTTPException(status_code=503, detail="Models not loaded.")
+
+@asynccontextmanager
+async def lifespan(app):
+    model_registry.start()
+    yield
+
+
+app = FastAPI(title="Crime Detection API with YOLO, (CLIP removed from Webcam), and Webcam Streaming", lifespan=lifespan)
 
 # Mount a static directory to serve your HTML file
 # This assumes your index.html is in a folder named 'static'
 #app.mount("/static", StaticFiles(directory="static"), name="static")
 
 os.makedirs(FRAME_FOLDER, exist_ok=True)
-# Create a subfolder for temporary webcam frames to keep things organized
-WEBCAM_TEMP_FRAME_FOLDER = os.path.join(FRAME_FOLDER, "webcam_temp")
-os.makedirs(WEBCAM_TEMP_FRAME_FOLDER, exist_ok=True)
 
 
-# --- Webcam Global State ---
-webcam_active_flag = False
-webcam_lock = asyncio.Lock()
+# --- Inference Executor ---
+# All blocking YOLO/CLIP work runs here so the event loop keeps serving other requests (e.g. /stop-webcam/)
+inference_executor = InferenceExecutor(
+    max_workers=INFERENCE_WORKERS, max_queue=INFERENCE_QUEUE_SIZE, on_queue_wait=metrics.QUEUE_WAIT_SECONDS.observe
+)
+
+
+# --- Analysis Cache ---
+# Re-uploads of identical bytes (common from the dashboard) skip YOLO/CLIP entirely
+analysis_cache = AnalysisCache(
+    max_entries=ANALYSIS_CACHE_SIZE, disk_dir=ANALYSIS_CACHE_DIR,
+    max_disk_bytes=ANALYSIS_CACHE_DISK_MB * 1024 * 1024
+)
+
+def model_version():
+    """Identifies the loaded model weights, so cached results are invalidated when they change."""
+    parts = []
+    parts.append(f"clip_backend={CLIP_BACKEND}{'-int8' if CLIP_QUANTIZE else ''}")
+    for path in (YOLO_MODEL_PATH, CLIP_MODEL_PATH):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}")
+    parts.append(f"yolo={'on' if yolo_model else 'off'}")
+    clip_classifier = clip_pipeline.clip_classifier
+    parts.append(f"clip={'off' if not clip_classifier else 'finetuned' if clip_classifier.use_finetuned else 'zero-shot'}")
+    if clip_classifier:
+        # Registered prompts change zero-shot verdicts
+        prompts = json.dumps(clip_classifier.prompts, sort_keys=True).encode()
+        parts.append(f"prompts={hashlib.sha256(prompts).hexdigest()[:12]}")
+    return "|".join(parts)
+
+def _is_cacheable(analysis):
+    clip_result = analysis.get("clip_crime_classification") or {}
+    return analysis.get("error") is None and "error" not in clip_result
+
+# --- Embedding Store ---
+# Every analyzed image / video frame leaves its CLIP embedding behind for "find similar scenes"
+embedding_store = EmbeddingStore(
+    EMBEDDING_STORE_DIR, exact_search_max=EMBEDDING_EXACT_SEARCH_MAX, nprobe=EMBEDDING_IVF_PROBES
+) if EMBEDDING_STORE_DIR else None
+
+def store_embeddings(analysis_id, kind, source, clip_results, frame_numbers=None):
+    """
+    Pop the "embedding" from each CLIP result and append them to the embedding store.
+    Re-analyses of content already in the store (same analysis id) are not stored twice.
+    """
+    embeddings, records = [], []
+    for i, clip_result in enumerate(clip_results):
+        embedding = clip_result.pop("embedding", None) if isinstance(clip_result, dict) else None
+        if embedding is None:
+            continue
+        embeddings.append(embedding)
+        records.append({
+            "analysis_id": analysis_id, "kind": kind, "source": source,
+            "frame_number": frame_numbers[i] if frame_numbers else None,
+            "image_name": clip_result.get("image_name"),
+            "predicted_class": clip_result.get("predicted_class"),
+            "crime_confidence": clip_result.get("crime_confidence"),
+        })
+    if embedding_store is None or not embeddings or analysis_id is None or embedding_store.has_analysis(analysis_id):
+        return
+    try:
+        embedding_store.append(np.stack(embeddings), records)
+    except Exception as e:
+        print(f"⚠️ Could not store embeddings for {source}: {e}")
+
+def _with_filename(analysis, filename):
+    """Relabel a cached image result with the filename of the upload it is being returned for."""
+    analysis["filename"] = filename
+    if isinstance(analysis.get("clip_crime_classification"), dict) and "image_name" in analysis["clip_crime_classification"]:
+        analysis["clip_crime_classification"]["image_name"] = filename
+    return analysis
 
 
 # --- Helper Functions ---
@@ -74,249 +231,829 @@ def yolo_detect_objects(frame_cv2):
     detections = []
     if not yolo_model:
         return detections
-    results = yolo_model(frame_cv2, verbose=False)
+    with yolo_lock, metrics.YOLO_FORWARD_SECONDS.time(batched="false"):
+        results = yolo_model(frame_cv2, verbose=False)
     for result in results:
-        for box in result.boxes:
-            class_id = int(box.cls)
-            class_name = yolo_model.names[class_id]
-            confidence = float(box.conf)
-            bbox = [int(coord) for coord in box.xyxy[0].tolist()]
-            detections.append({
-                "class": class_name,
-                "confidence": round(confidence, 3),
-                "box_xyxy": bbox
-            })
+        detections.extend(_yolo_result_to_detections(result))
+    return detections
+
+def _yolo_result_to_detections(result):
+    """Convert one ultralytics result to detection dicts, moving each box tensor to NumPy once."""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return []
+    class_ids = boxes.cls.cpu().numpy().astype(int).tolist()
+    confidences = [round(conf, 3) for conf in boxes.conf.cpu().numpy().tolist()] # Round as Python floats, not in float32
+    bboxes = boxes.xyxy.cpu().numpy().astype(int).tolist()
+    return [
+        {"class": yolo_model.names[class_id], "confidence": confidence, "box_xyxy": bbox}
+        for class_id, confidence, bbox in zip(class_ids, confidences, bboxes)
+    ]
+
+def yolo_detect_batch(frames_cv2, batch_size=YOLO_BATCH_SIZE):
+    """Run YOLO on in-memory frames, `batch_size` frames per call. Returns one detection list per frame."""
+    if not yolo_model:
+        return [[] for _ in frames_cv2]
+    batch_size = max(1, int(batch_size))
+    detections = []
+    for start in range(0, len(frames_cv2), batch_size):
+        with yolo_lock, metrics.YOLO_FORWARD_SECONDS.time(batched="true"):
+            results = yolo_model(list(frames_cv2[start:start + batch_size]), verbose=False)
+        detections.extend(_yolo_result_to_detections(result) for result in results)
     return detections
 
-async def process_single_image_analysis(file_content: bytes, filename: str):
+async def run_inference(fn, *args, **kwargs):
+    """Run a blocking model call on the inference executor, turning a full queue into a 503."""
     try:
-        image_np = np.frombuffer(file_content, np.uint8)
-        frame_cv2 = cv2.imdecode(image_np, cv2.IMREAD_COLOR)
-        if frame_cv2 is None:
-            raise ValueError("Could not decode image.")
-    except Exception as e:
-        return {
-            "filename": filename, "error": f"Invalid image file: {str(e)}",
-            "yolo_detections": [], "clip_crime_classification": None
-        }
+        return await inference_executor.run(fn, *args, **kwargs)
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+def run_directly(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+def run_on_inference_executor(fn, *args, **kwargs):
+    """Run one model call on the inference executor from another thread and wait for it."""
+    return inference_executor.submit(fn, *args, **kwargs).result()
 
-    yolo_results = yolo_detect_objects(frame_cv2.copy()) if yolo_model else []
-    if not yolo_model: print("YOLO model not loaded. Skipping YOLO for single image.")
+def run_profiled(profile, fn, *args, **kwargs):
+    """Run `fn(*args, profile=profile, **kwargs)` as one profiled job (wall time + optional trace)."""
+    with profile.job():
+        return fn(*args, profile=profile, **kwargs)
+
+def new_request_profile(profile, profile_trace, name):
+    """A RequestProfile for profile=true requests, None otherwise (so unprofiled requests pay nothing)."""
+    if not profile:
+        return None
+    if profile_trace is not None and profile_trace not in TRACE_KINDS:
+        raise HTTPException(status_code=400, detail=f"profile_trace must be one of {', '.join(TRACE_KINDS)}.")
+    return RequestProfile(trace=profile_trace, trace_dir=PROFILE_TRACE_DIR, name=name)
+
+def process_image_batch(uploads, profile=None):
+    """
+    Analyze a batch of (file_content, filename, analysis_id) uploads, possibly from different requests,
+    with one YOLO call and one CLIP call. Returns one result dict per upload, in order.
+    Runs on the inference executor via image_batcher (or directly for a profiled request).
+    """
+    results = [None] * len(uploads)
+    decoded = [] # (index, filename, BGR ndarray)
+    with profile_stage(profile, "decode", items=len(uploads)):
+        for i, (file_content, filename, _) in enumerate(uploads):
+            try:
+                image_np = np.frombuffer(file_content, np.uint8)
+                with metrics.IMAGE_DECODE_SECONDS.time():
+                    frame_cv2 = cv2.imdecode(image_np, cv2.IMREAD_COLOR)
+                if frame_cv2 is None:
+                    raise ValueError("Could not decode image.")
+                decoded.append((i, filename, frame_cv2))
+            except Exception as e:
+                results[i] = {
+                    "filename": filename, "error": f"Invalid image file: {str(e)}",
+                    "yolo_detections": [], "clip_crime_classification": None
+                }
+
+    if not decoded:
+        return results
+
+    frames = [frame_cv2 for _, _, frame_cv2 in decoded]
+    filenames = [filename for _, filename, _ in decoded]
+    metrics.FRAMES_PROCESSED.inc(len(frames), source="image")
+
+    try:
+        with profile_stage(profile, "yolo", items=len(frames), batches=1 if yolo_model else 0):
+            yolo_results = yolo_detect_batch(frames, batch_size=len(frames))
+    except Exception as e:
+        metrics.MODEL_ERRORS.inc(stage="yolo")
+        print(f"Error during batched YOLO processing: {e}")
+        yolo_results = [[] for _ in frames]
 
-    clip_crime_results = None
     if clip_pipeline.clip_classifier:
-        temp_image_path = os.path.join(WEBCAM_TEMP_FRAME_FOLDER, f"temp_single_{filename}")
         try:
-            cv2.imwrite(temp_image_path, frame_cv2)
-            clip_crime_results = clip_pipeline.predict_single_image(temp_image_path)
+            with profile_stage(profile, "clip", items=len(frames), batches=1):
+                clip_results = clip_pipeline.predict_batch(
+                    frames, batch_size=len(frames), image_names=filenames, with_embeddings=embedding_store is not None
+                )
         except Exception as e:
-            print(f"Error during CLIP processing for {filename}: {e}")
-            clip_crime_results = {"error": str(e)}
-        finally:
-            if os.path.exists(temp_image_path):
-                os.remove(temp_image_path)
+            metrics.MODEL_ERRORS.inc(stage="clip")
+            print(f"Error during batched CLIP processing: {e}")
+            clip_results = [{"error": str(e)} for _ in frames]
+    else:
+        clip_results = [{"error": "CLIP model not loaded."} for _ in frames]
+
+    for (i, filename, _), yolo_result, clip_result in zip(decoded, yolo_results, clip_results):
+        store_embeddings(uploads[i][2], "image", filename, [clip_result])
+        results[i] = {
+            "filename": filename, "yolo_detections": yolo_result,
+            "clip_crime_classification": clip_result, "error": None
+        }
+    return results
+
+def _upload_frames(upload, deduplicator=None):
+    """Sampled frames of a video that is still uploading. Hitting a limit or an undecodable upload fails the whole upload."""
+    try:
+        yield from clip_pipeline.iter_stream_frames(
+            upload, sample_interval_s=VIDEO_STREAM_SAMPLE_INTERVAL_S,
+            max_duration_s=VIDEO_STREAM_MAX_DURATION_S or None, deduplicator=deduplicator
+        )
+    except (VideoLimitExceeded, ValueError) as e: # PyAV's decode errors are ValueErrors too
+        upload.abort(e)
+        raise
+    finally:
+        upload.close_reader() # Whatever is left of the upload is only hashed from here on
+
+def _decode_video_batches(video, video_base_name, deduplicator=None, profile=None):
+    """
+    Pipeline source: sample frames from the video and group them into items of VIDEO_PIPELINE_BATCH_SIZE.
+    `video` is a file path, or an UploadPipe for a video decoded while it uploads.
+    """
+    video_specific_frame_folder = os.path.join(FRAME_FOLDER, video_base_name)
+    if SAVE_VIDEO_FRAMES:
+        if os.path.exists(video_specific_frame_folder): shutil.rmtree(video_specific_frame_folder)
+        os.makedirs(video_specific_frame_folder, exist_ok=True)
+
+    batch = []
+    extraction_time = 0.0 # Time spent in this generator, not waiting on downstream stages
+    started = time.perf_counter()
+    if isinstance(video, UploadPipe):
+        frames = _upload_frames(video, deduplicator)
     else:
-        print("CLIP model not loaded. Skipping CLIP for single image.")
-        clip_crime_results = {"error": "CLIP model not loaded."}
+        frames = clip_pipeline.iter_frames(video, seek=VIDEO_FRAME_SEEK, deduplicator=deduplicator)
+    for frame_number, frame_img in frames:
+        if SAVE_VIDEO_FRAMES:
+            cv2.imwrite(os.path.join(video_specific_frame_folder, clip_pipeline.frame_filename(frame_number)), frame_img)
+        batch.append((frame_number, frame_img))
+        if len(batch) >= VIDEO_PIPELINE_BATCH_SIZE:
+            extraction_time += time.perf_counter() - started
+            yield _video_pipeline_item(batch, video_base_name)
+            started = time.perf_counter()
+            batch = []
+    extraction_time += time.perf_counter() - started
+    metrics.FRAME_EXTRACTION_SECONDS.observe(extraction_time)
+    if profile:
+        profile.record("decode", extraction_time, items=deduplicator.frames_seen if deduplicator else None)
+    if batch:
+        yield _video_pipeline_item(batch, video_base_name)
 
+def _video_pipeline_item(batch, video_base_name):
     return {
-        "filename": filename, "yolo_detections": yolo_results,
-        "clip_crime_classification": clip_crime_results, "error": None
+        "frame_numbers": [n for n, _ in batch],
+        # Frame paths are relative to FRAME_FOLDER, and only exist on disk when SAVE_VIDEO_FRAMES is set
+        "frame_paths": [os.path.join(video_base_name, clip_pipeline.frame_filename(n)) for n, _ in batch],
+        "frames": [frame_img for _, frame_img in batch],
     }
 
-# --- Webcam Streaming Logic (Simplified to YOLO-only) ---
-async def generate_webcam_frames_with_detection():
-    global webcam_active_flag
-    cap = None
+def _preprocess_stage(item):
+    item["pixel_values"] = clip_pipeline.preprocess_images(item["frames"])
+    return item
 
-    try:
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
-            error_msg = "Error: Could not open webcam."
-            print(error_msg)
-            yield (b'--frame\r\nContent-Type: text/plain\r\n\r\n' + error_msg.encode() + b'\r\n')
-            return
+def _clip_stage(item, run_model):
+    item["clip_results"] = run_model(
+        clip_pipeline.classify_pixel_values,
+        item.pop("pixel_values"), item["frame_paths"], with_embeddings=embedding_store is not None
+    )
+    return item
 
-        print("Webcam stream started with YOLO object detection ONLY.")
-        async with webcam_lock:
-             webcam_active_flag = True
+def _yolo_stage(item, run_model):
+    if yolo_model:
+        item["yolo_results"] = run_model(yolo_detect_batch, item["frames"])
+    item.pop("frames") # Nothing downstream needs the pixels; release them early
+    return item
 
-        while True:
-            async with webcam_lock:
-                if not webcam_active_flag:
-                    print("Webcam flag turned off, stopping stream generation.")
-                    break
-
-            ret, frame_cv2 = cap.read()
-            if not ret:
-                print("Error: Failed to grab frame from webcam. Stopping.")
-                break
+def video_frame_results(item):
+    """Per-frame CLIP label and YOLO objects of one finished video pipeline item, JSON-ready."""
+    frame_paths = item.get("frame_paths", [])
+    frame_numbers = item.get("frame_numbers", [None] * len(frame_paths))
+    if "error" in item:
+        return [
+            {"frame_number": frame_number, "frame_path": frame_path, "error": item["error"]}
+            for frame_number, frame_path in zip(frame_numbers, frame_paths)
+        ]
+    yolo_results = item.get("yolo_results") if yolo_model else None
+    results = []
+    for i, (frame_number, frame_path) in enumerate(zip(frame_numbers, frame_paths)):
+        clip_result = {key: value for key, value in item["clip_results"][i].items() if key != "embedding"}
+        result = {"frame_number": frame_number, "frame_path": frame_path, "clip_crime_classification": clip_result}
+        if yolo_results is not None:
+            result["yolo_objects"] = yolo_results[i]
+        results.append(result)
+    return results
+
+def analyze_video_file(video, video_base_name, analysis_id=None, profile=None, on_frames=None, run_model=run_directly):
+    """
+    Sample frames from a saved video (or an UploadPipe) and run CLIP and YOLO on them.
+    Decode, CLIP preprocessing, CLIP and YOLO run as concurrent pipeline stages over bounded queues.
+    Every CLIP and YOLO call goes through `run_model(fn, *args, **kwargs)`: a plain call by default,
+    for when the whole analysis runs on the inference executor. An analysis that waits on a client (an UploadPipe)
+    runs elsewhere and passes run_on_inference_executor, so only the model batches take an inference slot.
+    `on_frames(frame_results)` is called with the per-frame results of each batch as soon as it is done
+    (see video_frame_results); batches can finish out of frame order.
+    """
+    clip_crime_summary = None
+    yolo_detections_on_extracted_frames = []
 
-            annotated_frame = frame_cv2.copy()
-            
-            # 1. YOLO Object Detection (Always On)
-            if yolo_model:
-                yolo_detections = yolo_detect_objects(frame_cv2)
-                for det in yolo_detections:
-                    x1, y1, x2, y2 = det['box_xyxy']
-                    label = f"{det['class']} ({det['confidence']:.2f})"
-                    cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    cv2.putText(annotated_frame, label, (x1, y1 - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    if clip_pipeline.clip_classifier:
+        try:
+            deduplicator = clip_pipeline.FrameDeduplicator()
+            pipeline = StagedPipeline(
+                _decode_video_batches(video, video_base_name, deduplicator, profile),
+                [
+                    Stage("preprocess", _preprocess_stage, PREPROCESS_WORKERS, VIDEO_PIPELINE_QUEUE_SIZE),
+                    Stage("clip", partial(_clip_stage, run_model=run_model), CLIP_WORKERS, VIDEO_PIPELINE_QUEUE_SIZE),
+                    Stage("yolo", partial(_yolo_stage, run_model=run_model), YOLO_WORKERS, VIDEO_PIPELINE_QUEUE_SIZE),
+                ],
+            )
+            items = []
+            for item in pipeline.iter_outputs():
+                items.append(item)
+                if on_frames:
+                    on_frames(video_frame_results(item))
+            if profile:
+                # Busy time per stage; stages overlap, so these can add up to more than wall time.
+                # The source is skipped: _decode_video_batches already recorded "decode".
+                for name, stats in pipeline.stage_stats.items():
+                    if name != pipeline.source_name:
+                        profile.record(name, stats["busy_s"], batches=stats["items"])
+                profile.set("frames_read", deduplicator.frames_seen)
+                profile.set("frames_skipped_duplicate", deduplicator.frames_skipped)
+                profile.set("frames_kept", deduplicator.frames_seen - deduplicator.frames_skipped)
+            items.sort(key=lambda item: item["frame_numbers"][0] if item.get("frame_numbers") else -1)
+
+            clip_results = []
+            frame_numbers = []
+            source_error = None
+            for item in items:
+                frame_paths = item.get("frame_paths", [])
+                frame_numbers.extend(item.get("frame_numbers", [None] * len(frame_paths)))
+                if "error" in item:
+                    metrics.MODEL_ERRORS.inc(stage=item["error"].split(":", 1)[0])
+                    if "frame_paths" not in item:
+                        source_error = item["error"].split(": ", 1)[-1] # The decoder failed; no frames to attach it to
+                    clip_results.extend({"image_name": frame_path, "error": item["error"]} for frame_path in frame_paths)
+                    if yolo_model:
+                        yolo_detections_on_extracted_frames.extend(
+                            {"frame_path": frame_path, "error": item["error"]} for frame_path in frame_paths
+                        )
+                    continue
+                clip_results.extend(item["clip_results"])
+                if yolo_model:
+                    yolo_detections_on_extracted_frames.extend(
+                        {"frame_path": frame_path, "yolo_objects": yolo_objects}
+                        for frame_path, yolo_objects in zip(frame_paths, item["yolo_results"])
+                    )
+
+            metrics.FRAMES_PROCESSED.inc(len(clip_results), source="video")
+            if profile:
+                profile.set("frames_analyzed", len(clip_results))
+            if isinstance(video, UploadPipe):
+                # The content hash is only known once the rest of the upload has been drained
+                analysis_id = video.wait_digest()
+            store_embeddings(analysis_id, "video", video_base_name, clip_results, frame_numbers)
+            if source_error:
+                clip_crime_summary = {"error": f"Video decoding error: {source_error}"}
+            elif not clip_results:
+                clip_crime_summary = {"error": "No frames extracted for CLIP."}
             else:
-                cv2.putText(annotated_frame, "YOLO Model Not Loaded", (10, 30), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-
-            # Encode frame as JPEG for streaming
-            ret_jpeg, buffer = cv2.imencode('.jpg', annotated_frame)
-            if not ret_jpeg:
-                print("Error: Failed to encode frame to JPEG.")
-                continue
-            
-            frame_bytes = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            
-            await asyncio.sleep(0.03) # Adjust sleep for desired frame rate vs server load (e.g. 0.03 for ~30fps target)
+                with profile_stage(profile, "aggregation", items=len(clip_results)):
+                    clip_crime_summary = clip_pipeline.aggregate_predictions(clip_results)
+        except Exception as e:
+            clip_crime_summary = {"error": f"CLIP video processing error: {str(e)}"}
+
+    return clip_crime_summary, yolo_detections_on_extracted_frames
+
+# --- Webcam Streaming Logic (Simplified to YOLO-only) ---
+def detect_webcam_frame(frame_cv2):
+    """YOLO on a webcam frame, through the shared inference executor. Raises InferenceQueueFull when saturated."""
+    detections = inference_executor.submit(yolo_detect_objects, frame_cv2).result()
+    metrics.FRAMES_PROCESSED.inc(source="webcam")
+    return detections
+
+def annotate_and_encode_webcam_frame(frame_cv2, yolo_detections):
+    """Draw the latest YOLO detections on a webcam frame and JPEG-encode it."""
+    annotated_frame = frame_cv2.copy()
+    
+    # 1. YOLO Object Detection (Always On)
+    if yolo_model:
+        for det in yolo_detections:
+            x1, y1, x2, y2 = det['box_xyxy']
+            label = f"{det['class']} ({det['confidence']:.2f})"
+            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(annotated_frame, label, (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    else:
+        cv2.putText(annotated_frame, "YOLO Model Not Loaded", (10, 30), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+
+    # Encode frame as JPEG for streaming
+    return cv2.imencode('.jpg', annotated_frame)
 
+def render_webcam_chunk(frame_cv2, yolo_detections):
+    """Annotate, encode and wrap one frame as a multipart chunk. Done once per frame for all viewers."""
+    ret_jpeg, buffer = annotate_and_encode_webcam_frame(frame_cv2, yolo_detections)
+    if not ret_jpeg:
+        print("Error: Failed to encode frame to JPEG.")
+        return None
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+
+async def generate_webcam_frames_with_detection(queue):
+    """Stream one viewer's share of the webcam broadcast until the hub stops or the viewer disconnects."""
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                print("Webcam broadcast ended, closing viewer stream.")
+                break
+            yield chunk
     except asyncio.CancelledError:
-        print("Webcam stream task was cancelled.")
-    except Exception as e:
-        print(f"An unexpected error occurred during webcam streaming: {e}")
-        error_msg_stream = f"Stream Error: {str(e)[:100]}"
-        try:
-            yield (b'--frame\r\nContent-Type: text/plain\r\n\r\n' + error_msg_stream.encode() + b'\r\n')
-        except Exception as e_yield:
-            print(f"Could not yield error to stream: {e_yield}")
+        print("Webcam viewer disconnected.")
     finally:
-        if cap and cap.isOpened():
-            cap.release()
-        async with webcam_lock:
-            webcam_active_flag = False
-            print("Webcam resources released and stream stopped.")
+        webcam_hub.unsubscribe(queue)
+
+
+# --- Webcam Global State ---
+# One capture + one YOLO loop + one encode per frame, shared by every /start-webcam/ viewer
+webcam_hub = StreamHub(
+    WEBCAM_SOURCE, detect_webcam_frame, render_webcam_chunk,
+    subscriber_queue_size=WEBCAM_SUBSCRIBER_QUEUE_SIZE, idle_timeout_s=WEBCAM_IDLE_TIMEOUT_S
+)
+
+
+# --- Multi-Source Streams ---
+def analyze_stream_batch(frames):
+    """YOLO + CLIP on one frame from each of several registered streams, through the inference executor."""
+    def run():
+        metrics.FRAMES_PROCESSED.inc(len(frames), source="stream")
+        yolo_results = yolo_detect_batch(frames, batch_size=len(frames))
+        if clip_pipeline.clip_classifier:
+            clip_results = clip_pipeline.predict_batch(frames, batch_size=len(frames))
+        else:
+            clip_results = [None] * len(frames)
+        return [
+            {"yolo_detections": yolo_result, "clip_crime_classification": clip_result}
+            for yolo_result, clip_result in zip(yolo_results, clip_results)
+        ]
+    return inference_executor.submit(run).result()
+
+stream_scheduler = StreamScheduler(analyze_stream_batch, max_batch_size=STREAM_BATCH_MAX_SIZE)
+
+
+# --- Metrics ---
+# Gauges read live state when /metrics is scraped, so they cost nothing between scrapes
+metrics.Gauge("detectifi_webcam_inference_fps", "YOLO inference rate on the webcam feed.", fn=lambda: webcam_hub.stats()["inference_fps"])
+metrics.Gauge("detectifi_webcam_viewers", "Connected webcam viewers.", fn=lambda: webcam_hub.stats()["subscribers"])
+metrics.Gauge("detectifi_inference_jobs_running", "Jobs running on the inference executor.", fn=lambda: inference_executor.stats()["running"])
+metrics.Gauge("detectifi_inference_jobs_queued", "Jobs waiting for the inference executor.", fn=lambda: inference_executor.stats()["queued"])
+metrics.Gauge("detectifi_inference_jobs_rejected", "Jobs rejected because the inference queue was full (cumulative).", fn=lambda: inference_executor.stats()["rejected"])
+metrics.Gauge("detectifi_models_ready", "1 once models are loaded and warmed up.", fn=lambda: 1 if model_registry.status()["ready"] else 0)
+
+
+# --- Dynamic Batching ---
+# Images from concurrent /process-images/ requests are merged into shared YOLO/CLIP batches
+image_batcher = DynamicBatcher(
+    process_image_batch, inference_executor.run,
+    max_batch_size=IMAGE_BATCH_MAX_SIZE, max_wait_ms=IMAGE_BATCH_MAX_WAIT_MS
+)
 
 
 # --- API Endpoints (Image and Video processing endpoints remain unchanged, using CLIP) ---
 
 @app.post("/process-images/", summary="Process multiple uploaded images (YOLO objects, CLIP crime type)")
-async def process_multiple_images_endpoint(files: List[UploadFile] = File(...)):
-    if not yolo_model and not (hasattr(clip_pipeline, 'clip_classifier') and clip_pipeline.clip_classifier):
-        raise HTTPException(status_code=503, detail="Models not loaded.")
+async def process_multiple_images_endpoint(
+    files: List[UploadFile] = File(...), profile: bool = False, profile_trace: Optional[str] = None
+):
+    """With profile=true the response becomes {"results": [...], "profile": {...}} and the cache is bypassed."""
+    require_models()
     if not files:
         raise HTTPException(status_code=400, detail="No files uploaded.")
-    results = []
-    for file in files:
+    request_profile = new_request_profile(profile, profile_trace, "process-images")
+    results = [None] * len(files)
+    uploads = [] # (index, contents, filename, cache_key) for every image not already cached
+    version = model_version()
+    for i, file in enumerate(files):
         if not file.content_type or not file.content_type.startswith("image/"):
-            results.append({
+            results[i] = {
                 "filename": file.filename, "error": "Invalid file type.",
                 "yolo_detections": [], "clip_crime_classification": None
-            })
+            }
             continue
         contents = await file.read()
-        results.append(await process_single_image_analysis(contents, file.filename))
         await file.close()
-    return results
+        digest = content_hash(contents)
+        cache_key = make_key(digest, version)
+        cached = analysis_cache.get(cache_key) if not request_profile else None
+        if cached is not None:
+            results[i] = _with_filename(cached, file.filename)
+            results[i]["cache_hit"] = True
+            continue
+        uploads.append((i, contents, file.filename, digest, cache_key))
 
-@app.post("/process-video/", summary="Process an uploaded video (YOLO objects, CLIP crime type)")
-async def process_video_endpoint(file: UploadFile = File(...)):
-    if not yolo_model and not (hasattr(clip_pipeline, 'clip_classifier') and clip_pipeline.clip_classifier):
-        raise HTTPException(status_code=503, detail="Models not loaded.")
-    if not file.content_type or not file.content_type.startswith("video/"):
-        raise HTTPException(status_code=400, detail="Invalid file type.")
+    batch = [(contents, filename, digest) for _, contents, filename, digest, _ in uploads]
+    if request_profile:
+        # Profiled requests run as their own batch so the timings belong to this request alone
+        analyses = await run_inference(run_profiled, request_profile, process_image_batch, batch) if batch else []
+    else:
+        try:
+            analyses = await asyncio.gather(*[image_batcher.submit(upload) for upload in batch])
+        except InferenceQueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    for (i, _, _, _, cache_key), analysis in zip(uploads, analyses):
+        if _is_cacheable(analysis):
+            analysis_cache.put(cache_key, analysis)
+        analysis["cache_hit"] = False
+        results[i] = analysis
+    if request_profile:
+        return {"results": results, "profile": request_profile.report()}
+    return results
 
+async def save_video_upload(file: UploadFile):
+    """
+    Copy a video upload to its own file in FRAME_FOLDER/temp_videos, hashing it on the way through.
+    Returns (path, sha256). Concurrent uploads with the same filename never share a file.
+    """
     temp_video_dir = os.path.join(FRAME_FOLDER, "temp_videos")
     os.makedirs(temp_video_dir, exist_ok=True)
-    temp_video_path = os.path.join(temp_video_dir, f"temp_{file.filename}")
+    extension = os.path.splitext(file.filename or "")[1] # Kept so OpenCV can still tell the container from the name
+    temp_video = tempfile.NamedTemporaryFile(dir=temp_video_dir, prefix="temp_", suffix=extension, delete=False)
+    temp_video_path = temp_video.name
+
+    def save_upload():
+        digest = hashlib.sha256()
+        with temp_video as buffer:
+            while chunk := file.file.read(1024 * 1024):
+                digest.update(chunk)
+                buffer.write(chunk)
+        return digest.hexdigest()
 
     try:
-        with open(temp_video_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        return temp_video_path, await asyncio.to_thread(save_upload)
     except Exception as e:
+        remove_temp_video(temp_video_path)
         raise HTTPException(status_code=500, detail=f"Could not save temp video: {str(e)}")
     finally:
         await file.close()
 
-    extracted_frame_paths = []
-    clip_crime_summary = None
-    yolo_detections_on_extracted_frames = []
+def remove_temp_video(temp_video_path):
+    # The temp_videos directory itself stays: another request may be saving into it right now
+    if os.path.exists(temp_video_path): os.remove(temp_video_path)
+
+@app.post("/process-video/", summary="Process an uploaded video (YOLO objects, CLIP crime type)")
+async def process_video_endpoint(file: UploadFile = File(...), profile: bool = False, profile_trace: Optional[str] = None):
+    """With profile=true the response gains a "profile" timing breakdown and the cache is bypassed."""
+    require_models()
+    if not file.content_type or not file.content_type.startswith("video/"):
+        raise HTTPException(status_code=400, detail="Invalid file type.")
+    request_profile = new_request_profile(profile, profile_trace, f"process-video_{file.filename}")
+
+    if not inference_executor.has_capacity():
+        raise HTTPException(status_code=503, detail="Inference queue is full.", headers={"Retry-After": "1"})
+
+    temp_video_path, video_digest = await save_video_upload(file)
+    cache_key = make_key(video_digest, model_version(), kind="video")
+    cached = analysis_cache.get(cache_key) if not request_profile else None
+    if cached is not None:
+        remove_temp_video(temp_video_path)
+        cached["filename"] = file.filename
+        cached["cache_hit"] = True
+        return cached
+
     video_base_name = os.path.splitext(file.filename)[0]
-    video_specific_frame_folder = os.path.join(FRAME_FOLDER, video_base_name)
+    try:
+        if request_profile:
+            clip_crime_summary, yolo_detections_on_extracted_frames = await run_inference(
+                run_profiled, request_profile, analyze_video_file, temp_video_path, video_base_name, video_digest
+            )
+        else:
+            clip_crime_summary, yolo_detections_on_extracted_frames = await run_inference(
+                analyze_video_file, temp_video_path, video_base_name, video_digest
+            )
+    finally:
+        remove_temp_video(temp_video_path)
 
-    if clip_pipeline.clip_classifier:
+    response = {
+        "filename": file.filename,
+        "clip_crime_classification_summary": clip_crime_summary,
+        "yolo_detections_on_extracted_frames": yolo_detections_on_extracted_frames,
+    }
+    if clip_crime_summary and "error" not in clip_crime_summary:
+        analysis_cache.put(cache_key, response)
+    response["cache_hit"] = False
+    if request_profile:
+        response["profile"] = request_profile.report()
+    return response
+
+def format_stream_event(event, stream_format):
+    """One progressive-results event as an NDJSON line or a Server-Sent Event."""
+    data = json.dumps(event)
+    if stream_format == "sse":
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+@app.post("/process-video-progressive/", summary="Process an uploaded video, streaming per-frame results as they finish")
+async def process_video_progressive_endpoint(file: UploadFile = File(...), format: str = "ndjson"):
+    """
+    Same analysis as /process-video/, streamed as NDJSON lines (default) or Server-Sent Events (format=sse):
+      {"type": "frames", "results": [...]}  per finished batch: frame_number, frame_path,
+                                            clip_crime_classification and yolo_objects of each frame
+      {"type": "summary", ...}              last: the full /process-video/ response
+      {"type": "error", "detail": "..."}    last instead, if the analysis fails mid-stream
+    Batches can finish out of order; sort by frame_number if order matters. A cache hit streams only the summary.
+    """
+    require_models()
+    if not file.content_type or not file.content_type.startswith("video/"):
+        raise HTTPException(status_code=400, detail="Invalid file type.")
+    if format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(STREAM_FORMATS)}.")
+    if not inference_executor.has_capacity():
+        raise HTTPException(status_code=503, detail="Inference queue is full.", headers={"Retry-After": "1"})
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} # Keep proxies from buffering the stream
+    temp_video_path, video_digest = await save_video_upload(file)
+    cache_key = make_key(video_digest, model_version(), kind="video")
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        remove_temp_video(temp_video_path)
+        cached["filename"] = file.filename
+        cached["cache_hit"] = True
+        return StreamingResponse(iter([format_stream_event({"type": "summary", **cached}, format)]), media_type=media_type, headers=headers)
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    def on_frames(frame_results): # Called on the inference thread
+        if frame_results:
+            loop.call_soon_threadsafe(events.put_nowait, {"type": "frames", "results": frame_results})
+
+    video_base_name = os.path.splitext(file.filename)[0]
+    try:
+        # Submitted before the response starts, so a full queue is still a plain 503
+        analysis = asyncio.wrap_future(inference_executor.submit(
+            analyze_video_file, temp_video_path, video_base_name, video_digest, on_frames=on_frames
+        ))
+    except InferenceQueueFull as e:
+        remove_temp_video(temp_video_path)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    # The job outlives the response if the client disconnects; clean up when it is really done.
+    # Every on_frames event was queued before this callback runs, so None is always the last event.
+    analysis.add_done_callback(lambda _: remove_temp_video(temp_video_path))
+    analysis.add_done_callback(lambda _: events.put_nowait(None))
+
+    async def event_stream():
+        while (event := await events.get()) is not None:
+            yield format_stream_event(event, format)
         try:
-            if os.path.exists(video_specific_frame_folder): shutil.rmtree(video_specific_frame_folder)
-            os.makedirs(video_specific_frame_folder, exist_ok=True)
-            extracted_frame_paths = clip_pipeline.extract_frames(video_path=temp_video_path, output_folder=video_specific_frame_folder)
-            
-            if not extracted_frame_paths:
-                clip_crime_summary = {"error": "No frames extracted for CLIP."}
-            else:
-                clip_crime_summary = clip_pipeline.predict_multiple_images(extracted_frame_paths)
-                if yolo_model:
-                    for frame_path in extracted_frame_paths:
-                        try:
-                            frame_img = cv2.imread(frame_path)
-                            if frame_img is not None:
-                                yolo_detections_on_extracted_frames.append({
-                                    "frame_path": os.path.relpath(frame_path, FRAME_FOLDER),
-                                    "yolo_objects": yolo_detect_objects(frame_img)
-                                })
-                        except Exception as e_yolo_vid:
-                             yolo_detections_on_extracted_frames.append({
-                                "frame_path": os.path.relpath(frame_path, FRAME_FOLDER), "error": str(e_yolo_vid)
-                            })
+            clip_crime_summary, yolo_detections_on_extracted_frames = analysis.result()
         except Exception as e:
-            clip_crime_summary = {"error": f"CLIP video processing error: {str(e)}"}
+            yield format_stream_event({"type": "error", "detail": f"Video analysis failed: {str(e)}"}, format)
+            return
+        response = {
+            "filename": file.filename,
+            "clip_crime_classification_summary": clip_crime_summary,
+            "yolo_detections_on_extracted_frames": yolo_detections_on_extracted_frames,
+        }
+        if clip_crime_summary and "error" not in clip_crime_summary:
+            analysis_cache.put(cache_key, response)
+        response["cache_hit"] = False
+        yield format_stream_event({"type": "summary", **response}, format)
 
-    if os.path.exists(temp_video_path): os.remove(temp_video_path)
-    if os.path.exists(temp_video_dir) and not os.listdir(temp_video_dir): os.rmdir(temp_video_dir)
+    return StreamingResponse(event_stream(), media_type=media_type, headers=headers)
 
-    return {
-        "filename": file.filename,
+async def feed_upload(request: Request, upload: UploadPipe, chunk_size=1024 * 1024, idle_timeout_s=None):
+    """
+    Pass the request body to `upload` in chunk_size pieces; writes that may block run off the event loop.
+    A client that sends nothing for `idle_timeout_s` seconds fails the upload with UploadStalled.
+    """
+    pending = bytearray()
+    chunks = request.stream()
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(anext(chunks), idle_timeout_s or None)
+            except StopAsyncIteration:
+                break
+            pending += chunk
+            if len(pending) >= chunk_size:
+                await asyncio.to_thread(upload.write, bytes(pending))
+                pending.clear()
+        if pending:
+            await asyncio.to_thread(upload.write, bytes(pending))
+        await asyncio.to_thread(upload.close)
+    except VideoLimitExceeded:
+        pass # Already recorded as upload.failure
+    except TimeoutError:
+        upload.abort(UploadStalled(f"No upload data received for {idle_timeout_s:.0f}s."))
+    except Exception as e:
+        upload.abort(ValueError(f"Upload interrupted: {e}"))
+
+@app.post("/process-video-stream/", summary="Analyze a video while it is still uploading (raw request body)")
+async def process_video_stream_endpoint(
+    request: Request, filename: str = "upload", profile: bool = False, profile_trace: Optional[str] = None
+):
+    """
+    The request body is the video file itself, not a multipart form, e.g.
+    `curl --data-binary @cam01.ts -H "Content-Type: video/mp2t" ".../process-video-stream/?filename=cam01.ts"`.
+    Frames are decoded with PyAV and analyzed while the body arrives; nothing is written to disk.
+    Same response as /process-video/, except that containers without a duration (e.g. piped MPEG-TS)
+    are sampled every VIDEO_STREAM_SAMPLE_INTERVAL_S seconds to the end instead of 50 frames spread over them.
+    The result is cached under the content hash, so a later /process-video/ upload of the same file is a cache hit.
+    """
+    require_models()
+    content_type = request.headers.get("content-type", "")
+    if not (content_type.startswith("video/") or content_type.startswith("application/octet-stream")):
+        raise HTTPException(status_code=400, detail="Invalid file type; send the raw video with a video/* Content-Type.")
+    content_length = request.headers.get("content-length")
+    if VIDEO_STREAM_MAX_BYTES and content_length and content_length.isdigit() and int(content_length) > VIDEO_STREAM_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload is larger than the {VIDEO_STREAM_MAX_BYTES} byte limit.")
+    request_profile = new_request_profile(profile, profile_trace, f"process-video-stream_{filename}")
+
+    if not inference_executor.has_capacity():
+        raise HTTPException(status_code=503, detail="Inference queue is full.", headers={"Retry-After": "1"})
+
+    upload = UploadPipe(max_bytes=VIDEO_STREAM_MAX_BYTES or None, max_buffered_chunks=VIDEO_STREAM_BUFFER_MB)
+    video_base_name = os.path.splitext(os.path.basename(filename))[0] or "upload"
+    # Decoding waits on the client, so it runs on a plain thread; only the model batches take inference slots
+    if request_profile:
+        analysis = asyncio.ensure_future(asyncio.to_thread(
+            run_profiled, request_profile, analyze_video_file, upload, video_base_name, run_model=run_on_inference_executor
+        ))
+    else:
+        analysis = asyncio.ensure_future(asyncio.to_thread(
+            analyze_video_file, upload, video_base_name, run_model=run_on_inference_executor
+        ))
+    # If the job fails or finishes before reading everything, the rest of the body must not block on a full pipe
+    analysis.add_done_callback(lambda _: upload.close_reader())
+
+    await feed_upload(request, upload, idle_timeout_s=VIDEO_STREAM_IDLE_TIMEOUT_S)
+    clip_crime_summary, yolo_detections_on_extracted_frames = await analysis
+    if upload.failure:
+        status_code = 413 if isinstance(upload.failure, VideoLimitExceeded) else 408 if isinstance(upload.failure, UploadStalled) else 400
+        raise HTTPException(status_code=status_code, detail=str(upload.failure))
+
+    response = {
+        "filename": filename,
         "clip_crime_classification_summary": clip_crime_summary,
         "yolo_detections_on_extracted_frames": yolo_detections_on_extracted_frames,
     }
+    video_digest = upload.wait_digest()
+    if video_digest and clip_crime_summary and "error" not in clip_crime_summary:
+        analysis_cache.put(make_key(video_digest, model_version(), kind="video"), response)
+    response["cache_hit"] = False
+    if request_profile:
+        response["profile"] = request_profile.report()
+    return response
+
+@app.get("/healthz", summary="Liveness: the process is up and serving requests")
+async def healthz_endpoint():
+    return {"status": "ok"}
+
+@app.get("/readyz", summary="Readiness: models loaded and warmed up, with load/warm-up timings")
+async def readyz_endpoint():
+    status = model_registry.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status, headers={"Retry-After": "5"})
+    return status
+
+@app.get("/metrics", summary="Prometheus metrics: per-stage latency histograms, frame and error counters")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
+@app.get("/inference-queue/", summary="Inference executor queue depth and counters")
+async def inference_queue_endpoint():
+    stats = inference_executor.stats()
+    stats["image_batcher"] = image_batcher.stats()
+    stats["analysis_cache"] = analysis_cache.stats()
+    return stats
 
-@app.get("/start-webcam/", summary="Start live webcam feed with YOLO and CLIP analysis")
+
+@app.get("/start-webcam/", summary="Start (or join) the live webcam feed with YOLO analysis")
 async def start_webcam_streaming_endpoint():
-    global webcam_active_flag
+    if not model_registry.loading_finished:
+        raise HTTPException(status_code=503, detail="Models are still loading.", headers={"Retry-After": "5"})
     if not yolo_model:
         raise HTTPException(status_code=503, detail="YOLO model not loaded. Cannot start webcam.")
 
-    async with webcam_lock:
-        if webcam_active_flag:
-            raise HTTPException(status_code=409, detail="Webcam is already active.")
-        
-        cap_test = cv2.VideoCapture(0)
-        if not cap_test.isOpened():
-            cap_test.release()
-            raise HTTPException(status_code=500, detail="Could not open webcam. Ensure it's connected and not in use.")
-        cap_test.release()
-        
-        webcam_active_flag = True
-
-    return StreamingResponse(generate_webcam_frames_with_detection(), media_type='multipart/x-mixed-replace; boundary=frame')
-
-@app.get("/stop-webcam/", summary="Stop the live webcam feed")
+    if not await webcam_hub.start():
+        raise HTTPException(status_code=500, detail="Could not open webcam. Ensure it's connected and not in use.")
+
+    queue = webcam_hub.subscribe()
+    return StreamingResponse(generate_webcam_frames_with_detection(queue), media_type='multipart/x-mixed-replace; boundary=frame')
+
+@app.get("/stop-webcam/", summary="Stop the live webcam feed for all viewers")
 async def stop_webcam_streaming_endpoint():
-    global webcam_active_flag
     stopped_message = "Webcam stop signal sent. The stream will terminate gracefully."
     already_stopped_message = "Webcam is not currently active."
     
-    async with webcam_lock:
-        if not webcam_active_flag:
-            return {"message": already_stopped_message}
-        
-        print("Sending stop signal to webcam stream...")
-        webcam_active_flag = False
+    if not webcam_hub.running:
+        return {"message": already_stopped_message}
 
+    print("Sending stop signal to webcam stream...")
+    await webcam_hub.stop()
     return {"message": stopped_message}
 
+class PromptRegistration(BaseModel):
+    prompts: Dict[str, str] # {class_name: prompt}; existing classes get their prompt replaced, new ones are added
+
+def require_clip():
+    require_models()
+    if not clip_pipeline.clip_classifier:
+        raise HTTPException(status_code=503, detail="CLIP model not loaded.")
+
+@app.get("/clip/prompts", summary="Current CLIP classes and prompts")
+async def list_prompts_endpoint():
+    require_clip()
+    clip_classifier = clip_pipeline.clip_classifier
+    return {
+        "classes": clip_classifier.class_names,
+        "prompts": clip_classifier.prompts,
+        "text_tower_loaded": clip_classifier.has_text_tower(),
+    }
+
+@app.post("/clip/prompts", summary="Add CLIP classes or replace prompts (zero-shot); loads the text tower temporarily if needed")
+async def register_prompts_endpoint(registration: PromptRegistration):
+    require_clip()
+    if not registration.prompts or not all(name.strip() and prompt.strip() for name, prompt in registration.prompts.items()):
+        raise HTTPException(status_code=400, detail="Prompts must map non-empty class names to non-empty prompts.")
+    classes = await run_inference(clip_pipeline.clip_classifier.register_prompts, registration.prompts)
+    return {"classes": classes}
+
+def require_embedding_store(k):
+    if embedding_store is None:
+        raise HTTPException(status_code=503, detail="Embedding store is disabled (EMBEDDING_STORE_DIR is empty).")
+    if not 1 <= k <= 100:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 100.")
+
+@app.get("/embeddings/", summary="Embedding store size and search mode")
+async def embeddings_stats_endpoint():
+    if embedding_store is None:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_store.stats()}
+
+@app.post("/embeddings/search", summary="Find past images/frames most similar to an uploaded image (CLIP cosine similarity)")
+async def search_embeddings_endpoint(file: UploadFile = File(...), k: int = 10):
+    require_embedding_store(k)
+    require_clip()
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Invalid file type.")
+    contents = await file.read()
+    await file.close()
+    frame_cv2 = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+    if frame_cv2 is None:
+        raise HTTPException(status_code=400, detail="Could not decode image.")
+    query = (await run_inference(clip_pipeline.embed_images, [frame_cv2]))[0]
+    results = await asyncio.to_thread(embedding_store.search, query, k)
+    return {"filename": file.filename, "results": results}
+
+@app.get("/embeddings/{row_id}/similar", summary="Find past images/frames most similar to a stored one")
+async def similar_embeddings_endpoint(row_id: int, k: int = 10, exclude_same_analysis: bool = True):
+    require_embedding_store(k)
+    try:
+        query = embedding_store.vector(row_id)
+        record = embedding_store.record(row_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Embedding not found.")
+    exclude = record.get("analysis_id") if exclude_same_analysis else None
+    results = await asyncio.to_thread(embedding_store.search, query, k + 1, exclude)
+    return {"query": record, "results": [result for result in results if result["id"] != row_id][:k]}
+
+class StreamRegistration(BaseModel):
+    source: str # Device index ("0"), video file path, or RTSP/HTTP URL
+    target_fps: float = 1.0 # How often this source's newest frame is analyzed
+    loop: bool = True # Rewind video files at the end (lets local clips stand in for cameras)
+
+@app.post("/streams/", summary="Register a stream source for continuous YOLO/CLIP analysis")
+async def register_stream_endpoint(registration: StreamRegistration):
+    require_models()
+    try:
+        source_id = await asyncio.to_thread(
+            stream_scheduler.add_source, registration.source, registration.target_fps, registration.loop
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"source_id": source_id}
+
+@app.get("/streams/", summary="List registered stream sources with their latest results")
+async def list_streams_endpoint():
+    return {"scheduler": stream_scheduler.stats(), "sources": stream_scheduler.list_sources()}
+
+@app.get("/streams/{source_id}", summary="Latest analysis for one stream source")
+async def get_stream_endpoint(source_id: str):
+    stream = stream_scheduler.get_source(source_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Stream not found.")
+    return stream
+
+@app.delete("/streams/{source_id}", summary="Stop and unregister a stream source")
+async def remove_stream_endpoint(source_id: str):
+    if not await asyncio.to_thread(stream_scheduler.remove_source, source_id):
+        raise HTTPException(status_code=404, detail="Stream not found.")
+    return {"message": f"Stream {source_id} stopped."}
+
+@app.get("/webcam-status/", summary="Webcam broadcast viewers, throughput and inference FPS")
+async def webcam_status_endpoint():
+    return webcam_hub.stats()
+
 
 if __name__ == "__main__":
     import uvicorn
     print("Starting Uvicorn server for crime detection API (Webcam: YOLO only)...")
     os.makedirs(FRAME_FOLDER, exist_ok=True)
-    os.makedirs(WEBCAM_TEMP_FRAME_FOLDER, exist_ok=True)
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,139 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers a sub-millisecond decode up to a multi-second video extraction
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonic count, optionally split by labels."""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values.items()]
+
+
+class Gauge(_Metric):
+    """Point-in-time value. With `fn`, the value is read when /metrics is scraped."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, fn=None):
+        super().__init__(name, documentation)
+        self._fn = fn
+        self._value = 0.0
+
+    def set(self, value):
+        self._value = value
+
+    def _samples(self):
+        value = self._fn() if self._fn else self._value
+        return [f"{self.name} {_format_value(float(value))}"]
+
+
+class Histogram(_Metric):
+    """Latency distribution in cumulative buckets, as Prometheus expects. observe() is a bisect and three adds."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        lines = []
+        for key, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(values[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# --- Pipeline metrics ---
+IMAGE_DECODE_SECONDS = Histogram("detectifi_image_decode_seconds", "cv2.imdecode time per uploaded image.")
+YOLO_FORWARD_SECONDS = Histogram("detectifi_yolo_forward_seconds", "YOLO forward time per call.", labelnames=("batched",))
+CLIP_PREPROCESS_SECONDS = Histogram("detectifi_clip_preprocess_seconds", "CLIP preprocessing time per batch.")
+CLIP_FORWARD_SECONDS = Histogram("detectifi_clip_forward_seconds", "CLIP forward + head time per batch.")
+FRAME_EXTRACTION_SECONDS = Histogram("detectifi_frame_extraction_seconds", "Time spent decoding and sampling frames, per video.")
+QUEUE_WAIT_SECONDS = Histogram("detectifi_inference_queue_wait_seconds", "Time jobs wait in the inference executor queue.")
+
+FRAMES_PROCESSED = Counter("detectifi_frames_processed_total", "Images and frames run through the models.", labelnames=("source",))
+FRAMES_SKIPPED = Counter("detectifi_frames_skipped_total", "Sampled video frames dropped as near-duplicates.")
+MODEL_ERRORS = Counter("detectifi_model_errors_total", "Failed model or pipeline-stage calls.", labelnames=("stage",))
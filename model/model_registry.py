@@ -0,0 +1,95 @@
+import threading
+import time
+
+
+class ModelRegistry:
+    """
+    Loads models on a background thread so the server can start listening immediately.
+    Each registered model has a `loader()` that returns True if the model is usable (False if it
+    is simply unavailable, e.g. missing weights) and an optional `warmup()` that runs a few dummy
+    forwards so the first real request does not pay for lazy kernel initialization.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._started_at = None
+        self._finished_at = None
+
+    def register(self, name, loader, warmup=None):
+        with self._lock:
+            self._models[name] = {
+                "loader": loader, "warmup": warmup,
+                "status": "pending", "load_s": None, "warmup_s": None, "error": None,
+            }
+
+    def _set(self, name, **fields):
+        with self._lock:
+            self._models[name].update(fields)
+
+    def _load_all(self):
+        for name in list(self._models):
+            entry = self._models[name]
+            self._set(name, status="loading")
+            started = time.perf_counter()
+            try:
+                available = entry["loader"]()
+            except Exception as e:
+                print(f"❌ Error loading {name}: {e}")
+                self._set(name, status="failed", error=str(e), load_s=round(time.perf_counter() - started, 3))
+                continue
+            self._set(name, load_s=round(time.perf_counter() - started, 3))
+            if not available:
+                self._set(name, status="unavailable")
+                continue
+
+            if entry["warmup"]:
+                self._set(name, status="warming_up")
+                started = time.perf_counter()
+                try:
+                    entry["warmup"]()
+                except Exception as e:
+                    # A failed warm-up only costs first-request latency; the model is still usable
+                    print(f"⚠️ Warm-up for {name} failed: {e}")
+                    self._set(name, error=f"warmup: {e}")
+                self._set(name, warmup_s=round(time.perf_counter() - started, 3))
+            self._set(name, status="ready")
+            print(f"✅ {name} ready (load {entry['load_s']}s, warm-up {entry['warmup_s']}s)")
+        self._finished_at = time.time()
+
+    def start(self):
+        """Start loading every registered model in the background (idempotent)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._started_at = time.time()
+            self._thread = threading.Thread(target=self._load_all, name="model-loader", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    @property
+    def loading_finished(self):
+        return self._finished_at is not None
+
+    def is_ready(self, name=None):
+        """True once loading has finished and `name` (or, if None, at least one model) is ready."""
+        with self._lock:
+            if name is not None:
+                return name in self._models and self._models[name]["status"] == "ready"
+            return self._finished_at is not None and any(m["status"] == "ready" for m in self._models.values())
+
+    def status(self):
+        with self._lock:
+            return {
+                "ready": self._finished_at is not None and any(m["status"] == "ready" for m in self._models.values()),
+                "loading_finished": self._finished_at is not None,
+                "total_load_s": round(self._finished_at - self._started_at, 3) if self._finished_at and self._started_at else None,
+                "models": {
+                    name: {key: value for key, value in entry.items() if key not in ("loader", "warmup")}
+                    for name, entry in self._models.items()
+                },
+            }
@@ -0,0 +1,130 @@
+import cProfile
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+TRACE_KINDS = ("cprofile", "torch")
+
+# cProfile and torch.profiler both hook the whole interpreter, so only one trace can run at a time
+_trace_lock = threading.Lock()
+
+
+class RequestProfile:
+    """
+    Timing breakdown for one profiled request. It only exists when a request asks for profile=true;
+    unprofiled requests pass None and every call site skips the bookkeeping.
+    `trace` optionally records a cProfile (.prof, open with pstats or snakeviz) or a torch.profiler
+    Chrome trace (.json) of the whole inference job into `trace_dir`.
+    """
+
+    def __init__(self, trace=None, trace_dir="profiles", name="request"):
+        if trace is not None and trace not in TRACE_KINDS:
+            raise ValueError(f"Unknown trace kind '{trace}'. Expected one of {TRACE_KINDS}.")
+        self.trace = trace
+        self.trace_dir = trace_dir
+        self.name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)[:64] or "request"
+        self.trace_file = None
+        self.trace_error = None
+        self.wall_s = None
+        self._stages = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, items=None, batches=None):
+        with self._lock:
+            stage = self._stages.setdefault(name, {"calls": 0, "total_s": 0.0, "items": 0, "batches": 0})
+            stage["calls"] += 1
+            stage["total_s"] += seconds
+            stage["items"] += items or 0
+            stage["batches"] += batches or 0
+
+    @contextmanager
+    def stage(self, name, items=None, batches=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started, items, batches)
+
+    def set(self, name, value):
+        with self._lock:
+            self._counters[name] = value
+
+    @contextmanager
+    def job(self):
+        """Wrap the whole inference job: measures wall time and runs the requested trace, if any."""
+        started = time.perf_counter()
+        tracer = self._start_trace() if self.trace else None
+        try:
+            yield
+        finally:
+            self.wall_s = time.perf_counter() - started
+            if tracer is not None:
+                self._stop_trace(tracer)
+
+    def _start_trace(self):
+        if not _trace_lock.acquire(blocking=False):
+            self.trace_error = "Another profiled request is already tracing; timings only."
+            return None
+        try:
+            if self.trace == "cprofile":
+                tracer = cProfile.Profile()
+                tracer.enable()
+            else:
+                import torch
+                activities = [torch.profiler.ProfilerActivity.CPU]
+                if torch.cuda.is_available():
+                    activities.append(torch.profiler.ProfilerActivity.CUDA)
+                tracer = torch.profiler.profile(activities=activities)
+                tracer.__enter__()
+            return tracer
+        except Exception as e:
+            _trace_lock.release()
+            self.trace_error = f"Could not start {self.trace} trace: {e}"
+            return None
+
+    def _stop_trace(self, tracer):
+        try:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            if self.trace == "cprofile":
+                tracer.disable()
+                path = os.path.join(self.trace_dir, f"{stamp}_{self.name}.prof")
+                tracer.dump_stats(path)
+            else:
+                tracer.__exit__(None, None, None)
+                path = os.path.join(self.trace_dir, f"{stamp}_{self.name}.trace.json")
+                tracer.export_chrome_trace(path)
+            self.trace_file = path
+            print(f"💾 Request trace saved to {path}")
+        except Exception as e:
+            self.trace_error = f"Could not write {self.trace} trace: {e}"
+        finally:
+            _trace_lock.release()
+
+    def report(self):
+        with self._lock:
+            stages = {
+                name: {
+                    "calls": stage["calls"],
+                    "total_ms": round(1000 * stage["total_s"], 2),
+                    **({"items": stage["items"]} if stage["items"] else {}),
+                    **({"batches": stage["batches"]} if stage["batches"] else {}),
+                }
+                for name, stage in self._stages.items()
+            }
+            report = {
+                "wall_ms": round(1000 * self.wall_s, 2) if self.wall_s is not None else None,
+                "stages": stages,
+                "counters": dict(self._counters),
+            }
+        if self.trace:
+            report["trace"] = {"kind": self.trace, "file": self.trace_file, "error": self.trace_error}
+        return report
+
+
+def profile_stage(profile, name, items=None, batches=None):
+    """`profile.stage(...)` for a profiled request, a no-op context otherwise."""
+    return profile.stage(name, items, batches) if profile else nullcontext()
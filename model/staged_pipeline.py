@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+
+_DONE = object() # End-of-stream marker passed down the queues
+
+
+class Stage:
+    """One pipeline step: `fn(item)` runs on `workers` threads and returns the (possibly updated) item."""
+
+    def __init__(self, name, fn, workers=1, queue_size=4):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+
+
+class StagedPipeline:
+    """
+    Producer/consumer pipeline: a source iterator feeds a chain of stages over bounded queues,
+    with every stage running on its own threads. While stage N works on one item, stage N-1 is
+    already on the next, so end-to-end time tends towards the slowest stage rather than the sum.
+    Items are dicts. If a stage raises, the item gets an "error" entry and later stages pass it
+    through untouched. Output order is not guaranteed; callers sort by a key they put in the item.
+    """
+
+    def __init__(self, source, stages, source_name="decode"):
+        self.source = source
+        self.source_name = source_name
+        self.stages = list(stages)
+        self._lock = threading.Lock()
+        self.stage_stats = {
+            name: {"items": 0, "busy_s": 0.0}
+            for name in [source_name] + [stage.name for stage in self.stages]
+        }
+
+    def _record(self, name, elapsed):
+        with self._lock:
+            stats = self.stage_stats[name]
+            stats["items"] += 1
+            stats["busy_s"] += elapsed
+
+    def _run_source(self, out_queue, downstream_workers):
+        iterator = iter(self.source)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self._record(self.source_name, time.perf_counter() - started)
+                out_queue.put(item)
+        except Exception as e:
+            print(f"❌ Pipeline source '{self.source_name}' failed: {e}")
+            out_queue.put({"error": f"{self.source_name}: {e}"})
+        finally:
+            for _ in range(downstream_workers):
+                out_queue.put(_DONE)
+
+    def _run_worker(self, stage, in_queue, out_queue, finished, downstream_workers):
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                break
+            if "error" not in item:
+                started = time.perf_counter()
+                try:
+                    item = stage.fn(item)
+                except Exception as e:
+                    print(f"❌ Pipeline stage '{stage.name}' failed: {e}")
+                    item["error"] = f"{stage.name}: {e}"
+                self._record(stage.name, time.perf_counter() - started)
+            out_queue.put(item)
+
+        # The last worker of a stage to finish passes end-of-stream on to the next stage
+        with self._lock:
+            finished[stage.name] += 1
+            last_worker = finished[stage.name] == stage.workers
+        if last_worker:
+            for _ in range(downstream_workers):
+                out_queue.put(_DONE)
+
+    def run(self):
+        """Run the pipeline to completion on background threads and return every output item."""
+        return list(self.iter_outputs())
+
+    def iter_outputs(self):
+        """Run the pipeline on background threads, yielding each output item as soon as it leaves the last stage."""
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        queues.append(queue.Queue()) # Output queue, drained by this thread
+        downstream = [stage.workers for stage in self.stages[1:]] + [1]
+        finished = {stage.name: 0 for stage in self.stages}
+
+        threads = [threading.Thread(
+            target=self._run_source,
+            args=(queues[0], self.stages[0].workers if self.stages else 1),
+            name=f"pipeline-{self.source_name}", daemon=True
+        )]
+        for index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._run_worker,
+                    args=(stage, queues[index], queues[index + 1], finished, downstream[index]),
+                    name=f"pipeline-{stage.name}-{worker}", daemon=True
+                ))
+        for thread in threads:
+            thread.start()
+
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                break
+            yield item
+
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,164 @@
+import itertools
+import threading
+import time
+
+from live_stream import LatestFrameCapture # type: ignore
+
+
+def parse_source(source):
+    """"0" or 0 -> device index 0; anything else (file path, rtsp:// or http:// URL) is passed to OpenCV as-is."""
+    if isinstance(source, int):
+        return source
+    source = str(source).strip()
+    return int(source) if source.isdigit() else source
+
+
+class StreamSource:
+    """One registered feed: its capture thread, sampling rate and the latest analysis result."""
+
+    def __init__(self, source_id, source, target_fps, loop):
+        self.source_id = source_id
+        self.source = source
+        self.target_fps = target_fps
+        self.is_file = isinstance(source, str) and "://" not in source
+        self.capture = LatestFrameCapture(source, loop=loop and self.is_file, realtime=self.is_file)
+        self.next_due = 0.0
+        self.last_seq = 0
+        self.frames_analyzed = 0
+        self.frames_failed = 0
+        self.latest_result = None
+
+    def stats(self):
+        return {
+            "source_id": self.source_id,
+            "source": self.source,
+            "target_fps": self.target_fps,
+            "running": self.capture.running,
+            "frames_analyzed": self.frames_analyzed,
+            "frames_failed": self.frames_failed,
+            "latest_result": self.latest_result,
+        }
+
+
+class StreamScheduler:
+    """
+    Shares one set of models between many live feeds. Each source has its own capture thread that
+    keeps only its newest frame; a single scheduler thread repeatedly picks the sources whose next
+    sample is due (at their `target_fps`), rotating the starting point so every source gets a fair
+    turn, and runs up to `max_batch_size` of their frames through `analyze_batch(frames)` at once.
+    `analyze_batch` returns one result per frame; it may raise to skip a round (e.g. queue full).
+    """
+
+    def __init__(self, analyze_batch, max_batch_size=8):
+        self.analyze_batch = analyze_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.batches_run = 0
+        self._sources = {}
+        self._ids = itertools.count(1)
+        self._rotation = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+
+    def add_source(self, source, target_fps=1.0, loop=True):
+        """Open and register a feed. Returns its id, or raises ValueError if it cannot be opened."""
+        if target_fps <= 0:
+            raise ValueError("target_fps must be positive.")
+        stream = StreamSource(str(next(self._ids)), parse_source(source), float(target_fps), loop)
+        if not stream.capture.start():
+            raise ValueError(f"Could not open stream source: {source}")
+        with self._lock:
+            self._sources[stream.source_id] = stream
+            if not self._running:
+                self._running = True
+                self._thread = threading.Thread(target=self._loop, name="stream-scheduler", daemon=True)
+                self._thread.start()
+        return stream.source_id
+
+    def remove_source(self, source_id):
+        """Stop and unregister a feed. Returns False if there was no such feed."""
+        with self._lock:
+            stream = self._sources.pop(source_id, None)
+        if stream is None:
+            return False
+        stream.capture.stop()
+        return True
+
+    def get_source(self, source_id):
+        with self._lock:
+            stream = self._sources.get(source_id)
+        return stream.stats() if stream else None
+
+    def list_sources(self):
+        with self._lock:
+            return [stream.stats() for stream in self._sources.values()]
+
+    def _due_sources(self, now):
+        with self._lock:
+            streams = list(self._sources.values())
+        if not streams:
+            return [], None
+        start = self._rotation % len(streams)
+        ordered = streams[start:] + streams[:start]
+        due = []
+        next_wake = None
+        for stream in ordered:
+            if not stream.capture.running:
+                continue
+            seq, frame = stream.capture.latest()
+            if stream.next_due <= now and seq > stream.last_seq and frame is not None:
+                due.append((stream, seq, frame))
+            else:
+                wake = max(stream.next_due, now + 0.005)
+                next_wake = wake if next_wake is None else min(next_wake, wake)
+        return due, next_wake
+
+    def _loop(self):
+        while self._running:
+            now = time.monotonic()
+            due, next_wake = self._due_sources(now)
+            if not due:
+                with self._lock:
+                    if not self._sources:
+                        self._running = False
+                        break
+                time.sleep(min(max((next_wake or now + 0.05) - now, 0.001), 0.05))
+                continue
+
+            batch = due[:self.max_batch_size]
+            self._rotation += 1
+            try:
+                results = self.analyze_batch([frame for _, _, frame in batch])
+            except Exception as e:
+                for stream, _, _ in batch:
+                    stream.frames_failed += 1
+                print(f"⚠️ Stream batch of {len(batch)} frames skipped: {e}")
+                time.sleep(0.01)
+                continue
+
+            self.batches_run += 1
+            finished = time.monotonic()
+            for (stream, seq, _), result in zip(batch, results):
+                stream.last_seq = seq
+                stream.frames_analyzed += 1
+                stream.latest_result = {"frame_seq": seq, "analyzed_at": time.time(), **result}
+                # Stay on the source's own schedule, but don't try to catch up after a slow batch
+                stream.next_due = max(stream.next_due + 1.0 / stream.target_fps, finished)
+
+    def stop(self):
+        with self._lock:
+            streams = list(self._sources.values())
+            self._sources.clear()
+            self._running = False
+        for stream in streams:
+            stream.capture.stop()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sources": len(self._sources),
+                "max_batch_size": self.max_batch_size,
+                "batches_run": self.batches_run,
+            }
@@ -0,0 +1,120 @@
+"""The fast BGR frame preprocessing must feed CLIP the same pixels CLIPProcessor does on the equivalent RGB images."""
+import copy
+import types
+
+import numpy as np
+import pytest
+from PIL import Image
+from transformers import CLIPImageProcessor
+
+import clip_pipeline
+
+# Normalized pixel units; one grey level is about 0.015. A swapped R/B channel is off by about 1 on average.
+MEAN_TOLERANCE = 0.02
+MAX_TOLERANCE = 0.35
+SIZES = [(640, 480), (1280, 720), (360, 640), (224, 224), (160, 120), (301, 233)]
+
+
+def bgr_frame(width, height, seed=0):
+    """Blue, green and red hold unrelated patterns, so any channel mix-up shows."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.stack([
+        np.full((height, width), 30, dtype=np.float32),
+        np.broadcast_to(y, (height, width)),
+        np.broadcast_to(x, (height, width)),
+    ], axis=-1)
+    frame = frame + rng.normal(0, 8, frame.shape)
+    size = max(8, min(width, height) // 5)
+    frame[height // 3:height // 3 + size, width // 4:width // 4 + size] = (40, 200, 240)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def expected_pixel_values(processor, frames):
+    rgb = [Image.fromarray(np.ascontiguousarray(frame[..., ::-1])) for frame in frames]
+    return processor(images=rgb, return_tensors="pt")["pixel_values"]
+
+
+def assert_close(actual, expected):
+    assert tuple(actual.shape) == tuple(expected.shape)
+    diff = (actual.cpu() - expected).abs()
+    assert diff.mean().item() <= MEAN_TOLERANCE, f"mean |diff| {diff.mean().item():.4f}"
+    assert diff.max().item() <= MAX_TOLERANCE, f"max |diff| {diff.max().item():.4f}"
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    """A classifier with the real image processors and no model: these tests stop at pixel_values."""
+    processor = CLIPImageProcessor()
+    classifier = types.SimpleNamespace(
+        processor=processor, frame_preprocessor=clip_pipeline.FramePreprocessor.from_image_processor(processor)
+    )
+    monkeypatch.setattr(clip_pipeline, "clip_classifier", classifier)
+    return processor
+
+
+@pytest.fixture
+def captured_pixel_values(monkeypatch):
+    """Record what predict_batch hands to the model instead of running it."""
+    captured = []
+
+    def classify(pixel_values, image_names, with_embeddings=False):
+        captured.append(pixel_values.clone())
+        return [{"image_name": name} for name in image_names]
+
+    monkeypatch.setattr(clip_pipeline, "classify_pixel_values", classify)
+    return captured
+
+
+@pytest.mark.parametrize("width,height", SIZES)
+def test_preprocess_images_matches_clip_processor(processor, width, height):
+    frames = [bgr_frame(width, height, seed=i) for i in range(3)]
+    assert_close(clip_pipeline.preprocess_images(frames, fast=True), expected_pixel_values(processor, frames))
+
+
+def test_fast_and_clip_processor_paths_agree(processor):
+    frames = [bgr_frame(640, 480, seed=i) for i in range(3)]
+    assert_close(clip_pipeline.preprocess_images(frames, fast=True), clip_pipeline.preprocess_images(frames, fast=False))
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_predict_batch_feeds_rgb_pixels(processor, captured_pixel_values, monkeypatch, fast):
+    monkeypatch.setattr(clip_pipeline, "CLIP_FAST_PREPROCESS", fast)
+    frames = [bgr_frame(640, 480, seed=i) for i in range(4)]
+    clip_pipeline.predict_batch(frames, batch_size=2)
+    assert len(captured_pixel_values) == 2
+    assert_close(captured_pixel_values[0], expected_pixel_values(processor, frames[:2]))
+    assert_close(captured_pixel_values[1], expected_pixel_values(processor, frames[2:]))
+
+
+def test_predict_batch_mixed_pil_and_ndarray(processor, captured_pixel_values):
+    frames = [bgr_frame(640, 480, seed=i) for i in range(2)]
+    pil = Image.fromarray(np.ascontiguousarray(frames[1][..., ::-1]))
+    clip_pipeline.predict_batch([frames[0], pil], batch_size=2)
+    assert_close(captured_pixel_values[0], expected_pixel_values(processor, frames))
+
+
+def test_grayscale_and_bgra_frames(processor):
+    frame = bgr_frame(640, 480)
+    gray = frame[..., 1].copy()
+    bgra = np.dstack([frame, np.full(frame.shape[:2], 255, dtype=np.uint8)])
+    assert_close(clip_pipeline.preprocess_images([gray], fast=True), expected_pixel_values(processor, [np.dstack([gray] * 3)]))
+    assert_close(clip_pipeline.preprocess_images([bgra], fast=True), expected_pixel_values(processor, [frame]))
+
+
+def test_reused_buffer_is_overwritten_by_the_next_call(processor):
+    first, second = bgr_frame(640, 480, seed=1), bgr_frame(640, 480, seed=2)
+    kept = clip_pipeline.preprocess_images([first], fast=True)
+    reused = clip_pipeline.preprocess_images([first], reuse=True, fast=True)
+    clip_pipeline.preprocess_images([second], reuse=True, fast=True)
+    assert not reused.equal(kept) # Only safe when the batch is consumed before the next call
+    assert_close(kept, expected_pixel_values(processor, [first]))
+
+
+def test_frame_preprocessor_can_be_deep_copied(processor):
+    frame = bgr_frame(640, 480)
+    original = clip_pipeline.clip_classifier.frame_preprocessor
+    original([frame], reuse=True) # Allocates this thread's buffers
+    copied = copy.deepcopy(original)
+    assert_close(copied([frame]), expected_pixel_values(processor, [frame]))
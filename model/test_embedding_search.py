@@ -0,0 +1,66 @@
+"""An analyzed image leaves its CLIP embedding in the store, where /embeddings/search finds it again."""
+import types
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import clip_pipeline
+import main
+from analysis_cache import content_hash
+from embedding_store import EmbeddingStore
+
+
+def fake_embedding(frame):
+    """Normalized mean color, so differently colored images land far apart."""
+    vector = frame.reshape(-1, 3).mean(axis=0).astype(np.float32) + 1
+    return vector / np.linalg.norm(vector)
+
+
+def jpeg(color):
+    frame = np.full((64, 64, 3), color, dtype=np.uint8)
+    return cv2.imencode(".jpg", frame)[1].tobytes()
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    """The API with an empty store in tmp_path and a CLIP stand-in; no YOLO, no model loading."""
+    monkeypatch.setattr(main, "embedding_store", EmbeddingStore(str(tmp_path / "store")))
+    monkeypatch.setattr(main, "analysis_cache", main.AnalysisCache(max_entries=8))
+    monkeypatch.setattr(main, "yolo_model", None)
+    monkeypatch.setattr(type(main.model_registry), "loading_finished", True)
+    monkeypatch.setattr(clip_pipeline, "clip_classifier", types.SimpleNamespace(use_finetuned=True, prompts={}))
+
+    def predict_batch(frames, batch_size=None, image_names=None, with_embeddings=False):
+        results = []
+        for frame, name in zip(frames, image_names):
+            result = {"image_name": name, "predicted_class": "normal", "crime_confidence": 0.9}
+            if with_embeddings:
+                result["embedding"] = fake_embedding(frame)
+            results.append(result)
+        return results
+
+    monkeypatch.setattr(clip_pipeline, "predict_batch", predict_batch)
+    monkeypatch.setattr(clip_pipeline, "embed_images", lambda frames: np.stack([fake_embedding(frame) for frame in frames]))
+    return TestClient(main.app) # Not entered, so the lifespan (model loading) does not run
+
+
+def test_empty_store_is_enabled(client):
+    assert len(main.embedding_store) == 0
+    assert client.get("/embeddings/").json()["enabled"] is True
+
+
+def test_analyzed_image_is_found_by_search(client):
+    red, blue = jpeg((0, 0, 255)), jpeg((255, 0, 0))
+    for name, contents in (("red.jpg", red), ("blue.jpg", blue)):
+        response = client.post("/process-images/", files={"files": (name, contents, "image/jpeg")})
+        assert response.status_code == 200, response.text
+        assert "embedding" not in response.json()[0]["clip_crime_classification"]
+    assert len(main.embedding_store) == 2
+
+    response = client.post("/embeddings/search?k=1", files={"file": ("query.jpg", red, "image/jpeg")})
+    assert response.status_code == 200, response.text
+    [result] = response.json()["results"]
+    assert result["analysis_id"] == content_hash(red)
+    assert result["image_name"] == "red.jpg"
@@ -0,0 +1,78 @@
+"""/process-video-stream/: decoding waits on the client outside the inference executor, and a stalled client fails the upload."""
+import asyncio
+import io
+import threading
+import types
+
+import av
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import clip_pipeline
+import main
+from upload_pipe import UploadPipe, UploadStalled
+
+FPS = 10
+
+
+def mpegts(seconds):
+    """A piped-style MPEG-TS (no container duration) whose frames all differ, so none are deduplicated."""
+    buffer = io.BytesIO()
+    container = av.open(buffer, "w", format="mpegts")
+    stream = container.add_stream("mpeg2video", rate=FPS)
+    stream.width, stream.height, stream.pix_fmt = 64, 48, "yuv420p"
+    rng = np.random.default_rng(0)
+    for _ in range(seconds * FPS):
+        image = rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+        container.mux(stream.encode(av.VideoFrame.from_ndarray(image, format="bgr24")))
+    container.mux(stream.encode())
+    container.close()
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def model_calls(monkeypatch):
+    """A CLIP stand-in recording (thread name, frame count) per model batch; no YOLO, no model loading."""
+    calls = []
+
+    def classify(pixel_values, image_names, with_embeddings=False):
+        calls.append((threading.current_thread().name, len(image_names)))
+        return [{"image_name": name, "predicted_class": "normal", "crime_confidence": 0.9, "model_type": "fake"} for name in image_names]
+
+    monkeypatch.setattr(main, "embedding_store", None)
+    monkeypatch.setattr(main, "analysis_cache", main.AnalysisCache(max_entries=8))
+    monkeypatch.setattr(main, "yolo_model", None)
+    monkeypatch.setattr(type(main.model_registry), "loading_finished", True)
+    monkeypatch.setattr(clip_pipeline, "clip_classifier", types.SimpleNamespace(use_finetuned=True, prompts={}))
+    monkeypatch.setattr(clip_pipeline, "preprocess_images", lambda frames: len(frames))
+    monkeypatch.setattr(clip_pipeline, "classify_pixel_values", classify)
+    return calls
+
+
+def test_streamed_upload_only_runs_model_batches_on_the_executor(model_calls):
+    seconds = 80 # Longer than max_frames=50 one-second samples
+    response = TestClient(main.app).post(
+        "/process-video-stream/?filename=cam.ts", content=mpegts(seconds), headers={"Content-Type": "video/mp2t"}
+    )
+    assert response.status_code == 200, response.text
+    assert "error" not in response.json()["clip_crime_classification_summary"]
+    assert model_calls and all(thread.startswith("inference") for thread, _ in model_calls)
+    assert sum(frames for _, frames in model_calls) >= seconds - 1 # Sampled to the end, not capped at 50
+
+
+class StalledRequest:
+    """Sends one chunk, then nothing."""
+
+    async def stream(self):
+        yield b"\x47" * 188
+        await asyncio.sleep(3600)
+
+
+def test_stalled_client_fails_the_upload():
+    upload = UploadPipe()
+    asyncio.run(main.feed_upload(StalledRequest(), upload, idle_timeout_s=0.1))
+    assert isinstance(upload.failure, UploadStalled)
+    with pytest.raises(UploadStalled): # The decoder gets the failure instead of waiting forever
+        upload.read()
+    assert upload.wait_digest() is None
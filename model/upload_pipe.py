@@ -0,0 +1,102 @@
+import hashlib
+import queue
+import threading
+
+_EOF = object() # Marker written by close()
+
+
+class VideoLimitExceeded(Exception):
+    """A streamed upload went over the configured size or duration limit."""
+
+
+class UploadStalled(Exception):
+    """The client stopped sending a streamed upload before it was complete."""
+
+
+class UploadPipe:
+    """
+    File-like bridge from an HTTP request body to a decoder running on another thread.
+    The request handler write()s chunks as they arrive and the decoder read()s them (PyAV accepts
+    any object with a read method). At most `max_buffered_chunks` chunks wait in between, so a decoder
+    that falls behind slows the upload down instead of the upload piling up in memory or on disk.
+    Every byte is counted and hashed, including the ones written after the decoder stopped reading,
+    so the digest always covers the whole upload.
+    """
+
+    def __init__(self, max_bytes=None, max_buffered_chunks=16):
+        self.max_bytes = max_bytes
+        self.bytes_received = 0
+        self.failure = None # Exception that ended the upload early, from either side
+        self._digest = hashlib.sha256()
+        self._chunks = queue.Queue(maxsize=max(1, int(max_buffered_chunks)))
+        self._pending = memoryview(b"")
+        self._eof = False
+        self._reader_closed = threading.Event()
+        self._writer_done = threading.Event()
+
+    # --- Writer side (request handler) ---
+
+    def write(self, chunk):
+        """Hand a chunk to the decoder, blocking while the buffer is full. Raises once the upload has failed."""
+        if self.failure:
+            raise self.failure
+        self.bytes_received += len(chunk)
+        if self.max_bytes and self.bytes_received > self.max_bytes:
+            raise self.abort(VideoLimitExceeded(f"Upload is larger than the {self.max_bytes} byte limit."))
+        self._digest.update(chunk)
+        if not self._reader_closed.is_set():
+            self._chunks.put(chunk)
+
+    def close(self):
+        """End of upload: the decoder's next read past the buffered data returns b""."""
+        if not self._reader_closed.is_set():
+            self._chunks.put(_EOF)
+        self._writer_done.set()
+
+    def abort(self, error):
+        """Fail the upload from either side: pending and future reads and writes raise `error`. Returns it."""
+        if self.failure is None:
+            self.failure = error
+        try:
+            self._chunks.put_nowait(error) # Wakes a reader waiting on an empty buffer
+        except queue.Full:
+            pass # The reader is not blocked and will see self.failure on its next read
+        self._writer_done.set()
+        return error
+
+    # --- Reader side (decoder thread) ---
+
+    def read(self, size=-1):
+        """Up to `size` bytes, blocking until some arrive. Returns b"" at the end of the upload."""
+        while not self._pending:
+            if self.failure:
+                raise self.failure
+            if self._eof:
+                return b""
+            chunk = self._chunks.get()
+            if chunk is _EOF:
+                self._eof = True
+            elif isinstance(chunk, BaseException):
+                raise chunk
+            else:
+                self._pending = memoryview(chunk)
+        if size is None or size < 0:
+            size = len(self._pending)
+        data = bytes(self._pending[:size])
+        self._pending = self._pending[size:]
+        return data
+
+    def close_reader(self):
+        """The decoder is done: drop buffered chunks and let the writer drain the rest of the upload unbuffered."""
+        self._reader_closed.set()
+        while True:
+            try:
+                self._chunks.get_nowait()
+            except queue.Empty:
+                break
+
+    def wait_digest(self, timeout=None):
+        """sha256 of the whole upload once the writer is done, or None if the upload failed or timed out."""
+        if not self._writer_done.wait(timeout) or self.failure:
+            return None
+        return self._digest.hexdigest()